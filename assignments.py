@@ -0,0 +1,53 @@
+from sqlalchemy import Integer, literal, literal_column, union_all
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import NamedTuple, Optional
+import db
+
+# Set based changes of users assigned to task. Every change is one statement:
+# assignments are inserted with ON CONFLICT DO NOTHING and removed with one
+# DELETE, both in data-modifying CTEs which report affected users. Current
+# assignees are never loaded, repeating the same request changes nothing
+
+
+class AssigneesChange(NamedTuple):
+    added: set
+    removed: set
+    # Requested user IDs to add which don't belong to any user
+    missing: set
+
+
+async def change_assignees(task_id: int, instance: AsyncSession, add: set = frozenset(),
+                           remove: Optional[object] = None) -> AssigneesChange:
+    """Assign users in add to task and remove assignments matching remove,
+    a clause on user_id column of association table. Added and removed users
+    must be disjoint sets, statements of one query don't see each other"""
+    assoc = db.user_task_association
+    parts = []
+    if add:
+        users = db.select(db.UserT.user_id, literal(task_id, Integer)) \
+                  .where(db.UserT.user_id.in_(add), db.UserT.deleted_at.is_(None))
+        added = insert(assoc).from_select(['user_id', 'task_id'], users) \
+                             .on_conflict_do_nothing().returning(assoc.c.user_id).cte('added')
+        parts.append(db.select(literal_column("'added'"), added.c.user_id))
+        parts.append(db.select(literal_column("'found'"), db.UserT.user_id)
+                     .where(db.UserT.user_id.in_(add), db.UserT.deleted_at.is_(None)))
+    if remove is not None:
+        removed = db.delete(assoc).where(assoc.c.task_id == task_id, remove).returning(assoc.c.user_id).cte('removed')
+        parts.append(db.select(literal_column("'removed'"), removed.c.user_id))
+    result = {'added': set(), 'removed': set(), 'found': set()}
+    if parts:
+        for kind, user_id in (await instance.execute(union_all(*parts))).all():
+            result[kind].add(user_id)
+    return AssigneesChange(result['added'], result['removed'], set(add) - result['found'])
+
+async def add_assignees(task_id: int, user_ids: set, instance: AsyncSession) -> AssigneesChange:
+    return await change_assignees(task_id, instance, add=user_ids)
+
+async def remove_assignees(task_id: int, user_ids: set, instance: AsyncSession) -> AssigneesChange:
+    return await change_assignees(task_id, instance, remove=db.user_task_association.c.user_id.in_(user_ids))
+
+async def replace_assignees(task_id: int, user_ids: set, instance: AsyncSession) -> AssigneesChange:
+    """Task ends up assigned to exactly user_ids"""
+    return await change_assignees(task_id, instance, add=user_ids,
+                                  remove=db.user_task_association.c.user_id.not_in(user_ids))
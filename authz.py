@@ -0,0 +1,64 @@
+from fastapi import HTTPException
+from sqlalchemy import Integer, column, values
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import NamedTuple
+import db
+
+# Authorization checks answered by database with one query, without loading
+# task lists of the user or assigned users of the task
+
+
+class TaskAccess(NamedTuple):
+    is_owner: bool
+    is_assignee: bool
+
+    @property
+    def is_member(self) -> bool:
+        return self.is_owner or self.is_assignee
+
+
+def is_assignee_clause(user_id, task_id):
+    """EXISTS clause true when user is assigned to task. Arguments can be
+    values or columns"""
+    assoc = db.user_task_association
+    return db.exists().where(assoc.c.task_id == task_id, assoc.c.user_id == user_id)
+
+async def task_access(user_id: int, task_id: int, instance: AsyncSession) -> TaskAccess:
+    """Return relation of user to task. If task doesn't exist then raise HTTPException"""
+    query = db.select(db.TaskT.owner_id == user_id, is_assignee_clause(user_id, db.TaskT.task_id)) \
+              .where(db.TaskT.task_id == task_id)
+    row = (await instance.execute(query)).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail='Task not found')
+    return TaskAccess(*row)
+
+async def require_task_owner(user_id: int, task_id: int, instance: AsyncSession, action: str = 'update'):
+    if not (await task_access(user_id, task_id, instance)).is_owner:
+        raise HTTPException(status_code=403, detail=f'Permission denied. This user does not have permission to {action} this task.')
+
+async def require_task_member(user_id: int, task_id: int, instance: AsyncSession, action: str = 'comment'):
+    """User must own or be assigned to the task"""
+    if not (await task_access(user_id, task_id, instance)).is_member:
+        raise HTTPException(status_code=403, detail=f'Permission denied. This user does not have permission to {action} this task.')
+
+async def require_comment_author(user_id: int, comment, instance: AsyncSession, action: str = 'update',
+                                 task_owner_allowed: bool = False):
+    """User must be author of the comment, or owner of its task when
+    task_owner_allowed. Task is queried only for other users than author"""
+    if comment.user_id == user_id:
+        return
+    if not (task_owner_allowed and (await task_access(user_id, comment.task_id, instance)).is_owner):
+        raise HTTPException(status_code=403, detail=f'Permission denied. This user does not have permission to {action} this comment.')
+
+async def task_access_many(pairs: set, instance: AsyncSession) -> dict:
+    """Set based variant of task_access for (task_id, user_id) pairs. Returns
+    {(task_id, user_id): TaskAccess}, pairs with not existing task are omitted"""
+    if not pairs:
+        return {}
+    requested = values(column('task_id', Integer), column('user_id', Integer), name='requested').data(list(pairs))
+    query = db.select(requested.c.task_id, requested.c.user_id,
+                      db.TaskT.owner_id == requested.c.user_id,
+                      is_assignee_clause(requested.c.user_id, requested.c.task_id)) \
+              .join(db.TaskT, db.TaskT.task_id == requested.c.task_id)
+    return {(task_id, user_id): TaskAccess(is_owner, is_assignee)
+            for task_id, user_id, is_owner, is_assignee in (await instance.execute(query)).all()}
@@ -0,0 +1,2 @@
+"""Benchmark suite. Seeds database with generated data and drives API
+routes in process at configurable concurrency, see README (Benchmarks)"""
@@ -0,0 +1,100 @@
+import argparse
+import asyncio
+import datetime
+import json
+import platform
+import random
+import subprocess
+import httpx
+import db
+import main
+import ratelimit
+from bench.seed import seed, reset, SEED_PASSWORD
+from bench.driver import Context, SCENARIOS, run_scenario
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench', description='Seed database and benchmark API routes')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--tasks-per-user', type=int, default=10)
+    parser.add_argument('--comments-per-task', type=int, default=3)
+    parser.add_argument('--assignments-per-task', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0, help='random seed of generated data and requests')
+    parser.add_argument('--reset', action='store_true', help='delete ALL rows of application tables before seeding')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f'comma separated, available: {", ".join(SCENARIOS)}')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=5, help='untimed requests before each scenario')
+    parser.add_argument('--output', default='bench-results.json')
+    parser.add_argument('--baseline', help='results of previous run to compare with')
+    args = parser.parse_args(argv)
+    args.scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+    return args
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+async def run(args) -> dict:
+    # App lifespan configures engines and shuts bcrypt workers down at the end
+    # Benchmark sends all requests with one token and logs in from one address
+    main.app.dependency_overrides[ratelimit.limit_token] = lambda: None
+    ratelimit.login_email_limiter = ratelimit.login_ip_limiter = None
+    async with main.app.router.lifespan_context(main.app):
+        async with db.AsyncSessionLocal() as instance:
+            if args.reset:
+                await reset(instance)
+            data = await seed(instance, args.users, args.tasks_per_user, args.comments_per_task,
+                              args.assignments_per_task, args.seed)
+        ctx = Context(data=data, rng=random.Random(args.seed))
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            response = await client.post('/token', data={'username': data.emails[data.user_ids[0]],
+                                                         'password': SEED_PASSWORD})
+            ctx.headers = {'Authorization': f'Bearer {response.json()["access_token"]}'}
+            results = {}
+            for name in args.scenarios:
+                results[name] = await run_scenario(client, ctx, name, args.requests, args.concurrency, args.warmup)
+                print_result(name, results[name])
+    return {
+        'meta': {'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                 'git_revision': git_revision(), 'python': platform.python_version(),
+                 'args': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}},
+        'scenarios': results,
+    }
+
+def print_result(name: str, result: dict):
+    latency = result['latency_ms']
+    print(f'{name:<16} {result["throughput_rps"]:8.1f} req/s  p50 {latency["p50"]:8.2f} ms  '
+          f'p95 {latency["p95"]:8.2f} ms  p99 {latency["p99"]:8.2f} ms  '
+          f'queries/req {result["queries_per_request"]:5.2f}  errors {result["errors"]}')
+
+def print_comparison(results: dict, baseline: dict):
+    """Relative change against baseline, negative latency change is better"""
+    print(f'\nCompared with {baseline["meta"].get("git_revision")} ({baseline["meta"]["created_at"]})')
+    for name, result in results['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            continue
+        change = lambda new, old: f'{(new - old) / old * 100:+7.1f}%' if old else '    n/a'
+        print(f'{name:<16} throughput {change(result["throughput_rps"], before["throughput_rps"])}  '
+              f'p50 {change(result["latency_ms"]["p50"], before["latency_ms"]["p50"])}  '
+              f'p95 {change(result["latency_ms"]["p95"], before["latency_ms"]["p95"])}  '
+              f'p99 {change(result["latency_ms"]["p99"], before["latency_ms"]["p99"])}  '
+              f'queries/req {result["queries_per_request"] - before["queries_per_request"]:+.2f}')
+
+if __name__ == '__main__':
+    args = parse_args()
+    results = asyncio.run(run(args))
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f'\nResults written to {args.output}')
+    if args.baseline:
+        with open(args.baseline) as file:
+            print_comparison(results, json.load(file))
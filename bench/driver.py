@@ -0,0 +1,176 @@
+from dataclasses import dataclass, field
+from sqlalchemy import event
+from typing import Awaitable, Callable, Dict
+import asyncio
+import random
+import time
+import httpx
+import db
+from bench.seed import SeedData, SEED_PASSWORD, WORDS
+
+
+@dataclass
+class Context():
+    """State shared by requests of all scenarios"""
+    data: SeedData
+    rng: random.Random
+    headers: dict = field(default_factory=dict)
+
+    def task(self) -> tuple:
+        return self.rng.choice(list(self.data.task_owners.items()))
+
+
+# Scenarios send one request with given client and return the response.
+# Writing scenarios keep SeedData up to date, so they never fail on
+# duplicates (e.g. assigning already assigned user)
+
+async def login(client: httpx.AsyncClient, ctx: Context):
+    email = ctx.data.emails[ctx.rng.choice(ctx.data.user_ids)]
+    return await client.post('/token', data={'username': email, 'password': SEED_PASSWORD})
+
+async def list_tasks(client: httpx.AsyncClient, ctx: Context):
+    return await client.get('/tasks', params={'limit': 50}, headers=ctx.headers)
+
+async def list_users(client: httpx.AsyncClient, ctx: Context):
+    return await client.get('/users', params={'limit': 50}, headers=ctx.headers)
+
+async def get_task(client: httpx.AsyncClient, ctx: Context):
+    task_id, _ = ctx.task()
+    return await client.get(f'/tasks/{task_id}', headers=ctx.headers)
+
+async def get_task_summary(client: httpx.AsyncClient, ctx: Context):
+    task_id, _ = ctx.task()
+    return await client.get(f'/tasks/{task_id}', params={'view': 'summary'}, headers=ctx.headers)
+
+async def task_comments(client: httpx.AsyncClient, ctx: Context):
+    task_id, _ = ctx.task()
+    return await client.get(f'/tasks/{task_id}/comments', params={'limit': 50}, headers=ctx.headers)
+
+async def get_user(client: httpx.AsyncClient, ctx: Context):
+    return await client.get(f'/users/{ctx.rng.choice(ctx.data.user_ids)}', headers=ctx.headers)
+
+async def search_tasks(client: httpx.AsyncClient, ctx: Context):
+    return await client.get('/tasks/search', params={'q': ctx.rng.choice(WORDS), 'match': 'fulltext'},
+                            headers=ctx.headers)
+
+async def tasks_summary(client: httpx.AsyncClient, ctx: Context):
+    return await client.get('/tasks/summary', headers=ctx.headers)
+
+async def add_task(client: httpx.AsyncClient, ctx: Context):
+    user_id = ctx.rng.choice(ctx.data.user_ids)
+    response = await client.post('/tasks/add', params={'user_id': user_id, 'title': f'benchmark task of {user_id}',
+                                                       'description': ' '.join(ctx.rng.choices(WORDS, k=12))},
+                                 headers=ctx.headers)
+    if response.status_code == 200:
+        ctx.data.task_owners[response.json()['task_id']] = user_id
+    return response
+
+async def assign(client: httpx.AsyncClient, ctx: Context):
+    while True:
+        task_id, owner_id = ctx.task()
+        user_id = ctx.rng.choice(ctx.data.user_ids)
+        if user_id != owner_id and (task_id, user_id) not in ctx.data.assignments:
+            break
+    # Pair is reserved before awaiting, so concurrent requests pick other pairs
+    ctx.data.assignments.add((task_id, user_id))
+    return await client.post('/tasks/assign', params={'owner_id': owner_id, 'task_id': task_id,
+                                                      'user_id_to_assign': user_id}, headers=ctx.headers)
+
+async def comment(client: httpx.AsyncClient, ctx: Context):
+    task_id, owner_id = ctx.task()
+    return await client.post('/tasks/comments/add', params={'user_id': owner_id, 'task_id': task_id,
+                                                            'comment': ' '.join(ctx.rng.choices(WORDS, k=8))},
+                             headers=ctx.headers)
+
+STATUSES = ('open', 'in_progress')
+# Tasks changed by status_churn, few so that concurrent requests collide
+HOT_TASKS = 8
+
+async def status_churn(client: httpx.AsyncClient, ctx: Context):
+    """Concurrent opposite status changes of the same tasks mixed with deletes
+    of other tasks. Counters changed by them must not deadlock"""
+    task_ids = sorted(ctx.data.task_owners)
+    if ctx.rng.random() < 0.1 and len(task_ids) > HOT_TASKS:
+        task_id = ctx.rng.choice(task_ids[HOT_TASKS:])
+        # Deleted before awaiting, so other scenarios don't pick it
+        del ctx.data.task_owners[task_id]
+        return await client.delete(f'/tasks/delete/{task_id}', headers=ctx.headers)
+    task_id = ctx.rng.choice(task_ids[:HOT_TASKS])
+    return await client.post('/tasks/update', params={'owner_id': ctx.data.task_owners[task_id], 'task_id': task_id},
+                             json={'status': ctx.rng.choice(STATUSES)}, headers=ctx.headers)
+
+SCENARIOS: Dict[str, Callable[[httpx.AsyncClient, Context], Awaitable[httpx.Response]]] = {
+    'login': login,
+    'list_tasks': list_tasks,
+    'list_users': list_users,
+    'get_task': get_task,
+    'get_task_summary': get_task_summary,
+    'task_comments': task_comments,
+    'get_user': get_user,
+    'search_tasks': search_tasks,
+    'tasks_summary': tasks_summary,
+    'add_task': add_task,
+    'assign': assign,
+    'comment': comment,
+    'status_churn': status_churn,
+}
+
+
+class QueryCounter():
+    """Counts SQL statements executed by async engine"""
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(db.async_engine.sync_engine, 'before_cursor_execute', self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.async_engine.sync_engine, 'before_cursor_execute', self)
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+async def run_scenario(client: httpx.AsyncClient, ctx: Context, name: str, requests: int,
+                       concurrency: int, warmup: int = 0) -> dict:
+    """Send requests with given number of concurrent workers and return
+    latency percentiles (ms), throughput and SQL statements per request"""
+    scenario = SCENARIOS[name]
+    for _ in range(warmup):
+        await scenario(client, ctx)
+    latencies = []
+    statuses = {}
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            response = await scenario(client, ctx)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    with QueryCounter() as queries:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': sum(count for status, count in statuses.items() if status >= 400),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'throughput_rps': requests / elapsed,
+        'latency_ms': {'p50': percentile(latencies, 0.50), 'p95': percentile(latencies, 0.95),
+                       'p99': percentile(latencies, 0.99), 'mean': sum(latencies) / len(latencies),
+                       'max': latencies[-1]},
+        'queries_per_request': queries.count / requests,
+    }
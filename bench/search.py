@@ -0,0 +1,120 @@
+"""Benchmark of task search on large table. Seeds tasks and comments with SQL
+(1M tasks take a few minutes), then times search.search_task_ids for phrases
+of different selectivity and shows which indexes the plans use
+
+    python -m bench.search --reset --tasks 1000000
+    python -m bench.search            # reuse seeded rows
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import db
+import search
+from bench.seed import reset, SEED_PASSWORD, WORDS
+import security as sc
+
+# Phrases by expected number of matches. Rare words are seeded into every
+# RARE_EVERY-th task or comment only
+RARE_EVERY = 10000
+PHRASES = {
+    'rare title word': ('kubernetes', 'fulltext'),
+    'rare comment word': ('escalation', 'fulltext'),
+    'rare words': ('kubernetes OR escalation', 'fulltext'),
+    'common word': ('deploy', 'fulltext'),
+    'two common words': ('deploy database', 'fulltext'),
+    'fuzzy title': ('kubernetes rollot', 'fuzzy'),
+    'title prefix': ('kubern', 'fuzzy'),
+    'auto fallback': ('kubernetis rollout', 'auto'),
+}
+
+
+def random_words(count: int) -> str:
+    """SQL expression of count words drawn from bench.seed.WORDS"""
+    words = ', '.join(f"'{word}'" for word in WORDS)
+    word = f'(ARRAY[{words}])[1 + floor(random() * {len(WORDS)})::int]'
+    return " || ' ' || ".join([word] * count)
+
+async def seed_search(instance, tasks: int, comments_per_task: int, users: int = 1000):
+    """Insert users, tasks with random titles and descriptions and their comments"""
+    password = await sc.get_password_hash(SEED_PASSWORD)
+    await instance.execute(db.text("""
+        INSERT INTO users (username, email, password)
+        SELECT 'user ' || i, 'search' || i || '@example.com', :password FROM generate_series(1, :users) AS i
+    """), {'password': password.hash, 'users': users})
+    await instance.execute(db.text(f"""
+        INSERT INTO tasks (owner_id, title, description, status)
+        SELECT (SELECT min(user_id) FROM users) + i % :users,
+               CASE WHEN i % {RARE_EVERY} = 0 THEN 'kubernetes rollout ' || i
+                    ELSE {random_words(3)} || ' ' || i END,
+               {random_words(12)}, 'open'
+        FROM generate_series(1, :tasks) AS i
+    """), {'users': users, 'tasks': tasks})
+    await instance.execute(db.text(f"""
+        INSERT INTO comments (task_id, user_id, comment)
+        SELECT task_id, owner_id,
+               CASE WHEN (task_id + n) % {RARE_EVERY // 2} = 0 THEN 'escalation ' ELSE '' END || {random_words(8)}
+        FROM tasks CROSS JOIN generate_series(1, :comments) AS n
+    """), {'comments': comments_per_task})
+    await instance.commit()
+    await instance.execute(db.text('ANALYZE users, tasks, comments'))
+
+async def plan_indexes(instance, phrase: str, match: str) -> list:
+    """Names of indexes used by plan of the first page query"""
+    ranked = search._fuzzy_ranked(phrase) if match == 'fuzzy' else search._fulltext_ranked(phrase)
+    connection = await instance.connection()
+    compiled = ranked.compile(dialect=connection.dialect)
+    rows = await connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {compiled.string}',
+                                            tuple(compiled.params[name] for name in compiled.positiontup))
+    found = []
+    def walk(node):
+        if 'Index Name' in node and node['Index Name'] not in found:
+            found.append(node['Index Name'])
+        for child in node.get('Plans', ()):
+            walk(child)
+    plan = rows.scalar()
+    walk((json.loads(plan) if isinstance(plan, str) else plan)[0]['Plan'])
+    return found
+
+async def run(args) -> dict:
+    db.configure_engines()
+    results = {}
+    try:
+        async with db.AsyncSessionLocal() as instance:
+            if args.reset:
+                await reset(instance)
+                start = time.perf_counter()
+                await seed_search(instance, args.tasks, args.comments_per_task)
+                print(f'Seeded {args.tasks} tasks in {time.perf_counter() - start:.1f} s')
+            tasks = (await instance.execute(db.select(db.func.count()).select_from(db.TaskT))).scalar()
+            for name, (phrase, match) in PHRASES.items():
+                times = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    task_ids, used_match, _ = await search.search_task_ids(instance, phrase, match, args.limit, None)
+                    times.append((time.perf_counter() - start) * 1000)
+                results[name] = {'phrase': phrase, 'match': used_match, 'results': len(task_ids),
+                                 'median_ms': statistics.median(times), 'max_ms': max(times),
+                                 'indexes': await plan_indexes(instance, phrase, used_match)}
+    finally:
+        await db.dispose_engines()
+    return {'tasks': tasks, 'phrases': results}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m bench.search')
+    parser.add_argument('--tasks', type=int, default=1000000)
+    parser.add_argument('--comments-per-task', type=int, default=1)
+    parser.add_argument('--limit', type=int, default=20, help='page size')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--reset', action='store_true', help='delete ALL rows and seed --tasks tasks first')
+    parser.add_argument('--output', help='write results to JSON file')
+    args = parser.parse_args()
+    results = asyncio.run(run(args))
+    print(f'{results["tasks"]} tasks')
+    for name, result in results['phrases'].items():
+        print(f'{name:<18} {result["match"]:<9} {result["results"]:3} results  median {result["median_ms"]:9.1f} ms  '
+              f'max {result["max_ms"]:9.1f} ms  indexes {", ".join(result["indexes"]) or "-"}')
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
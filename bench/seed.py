@@ -0,0 +1,65 @@
+from dataclasses import dataclass, field
+from sqlalchemy.ext.asyncio import AsyncSession
+import random
+import db
+import security as sc
+from main import insert_many
+
+# Password of every seeded user
+SEED_PASSWORD = 'benchmark'
+
+
+@dataclass
+class SeedData():
+    """IDs of seeded rows, used by benchmark scenarios"""
+    user_ids: list = field(default_factory=list)
+    emails: dict = field(default_factory=dict)
+    # task_id -> owner_id
+    task_owners: dict = field(default_factory=dict)
+    assignments: set = field(default_factory=set)
+    comments: int = 0
+
+
+async def reset(instance: AsyncSession):
+    """Delete all rows of application tables"""
+    await instance.execute(db.text('TRUNCATE users, tasks, comments, user_task_association, '
+                                   'user_task_counts, task_count_deltas RESTART IDENTITY CASCADE'))
+    await instance.execute(db.update(db.task_status_totals).values(count=0))
+    await instance.commit()
+
+async def seed(instance: AsyncSession, users: int, tasks_per_user: int, comments_per_task: int,
+               assignments_per_task: int, random_seed: int = 0) -> SeedData:
+    """Insert generated users, tasks, comments and assignments. Same
+    random_seed generates the same data"""
+    rng = random.Random(random_seed)
+    data = SeedData()
+    # bcrypt is slow on purpose, so every user shares one hash
+    password = await sc.get_password_hash(SEED_PASSWORD)
+    prefix = f'bench{rng.randrange(10 ** 9)}'
+    rows = [{'username': f'user {i}', 'email': f'{prefix}.{i}@example.com', 'password': password}
+            for i in range(users)]
+    data.user_ids = await insert_many(db.UserT, db.UserT.user_id, rows, instance)
+    data.emails = {user_id: row['email'] for user_id, row in zip(data.user_ids, rows)}
+    rows = [{'owner_id': user_id, 'title': f'task {i} of user {user_id}',
+             'description': ' '.join(rng.choices(WORDS, k=12))}
+            for user_id in data.user_ids for i in range(tasks_per_user)]
+    task_ids = await insert_many(db.TaskT, db.TaskT.task_id, rows, instance)
+    data.task_owners = {task_id: row['owner_id'] for task_id, row in zip(task_ids, rows)}
+    for task_id, owner_id in data.task_owners.items():
+        # One extra candidate replaces owner if owner is drawn
+        candidates = rng.sample(data.user_ids, min(assignments_per_task + 1, len(data.user_ids)))
+        others = [user_id for user_id in candidates if user_id != owner_id][:assignments_per_task]
+        data.assignments.update((task_id, user_id) for user_id in others)
+    if data.assignments:
+        await instance.execute(db.insert(db.user_task_association),
+                               [{'task_id': task_id, 'user_id': user_id} for task_id, user_id in data.assignments])
+    rows = [{'task_id': task_id, 'user_id': owner_id, 'comment': ' '.join(rng.choices(WORDS, k=8))}
+            for task_id, owner_id in data.task_owners.items() for i in range(comments_per_task)]
+    data.comments = len(await insert_many(db.CommentT, db.CommentT.comment_id, rows, instance))
+    await instance.commit()
+    return data
+
+
+WORDS = ('deploy', 'release', 'database', 'migration', 'frontend', 'backend', 'review', 'login',
+         'report', 'invoice', 'customer', 'meeting', 'design', 'test', 'fix', 'bug', 'feature',
+         'update', 'server', 'cache', 'search', 'export', 'import', 'document', 'plan')
@@ -0,0 +1,104 @@
+"""Micro-benchmark of list response serialization. Compares FastAPI
+response_model path with TypeAdapter paths used by main.versioned_page
+
+    python -m bench.serialization --tasks 10000
+"""
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+import argparse
+import asyncio
+import json
+import time
+import db
+import main
+import loaders
+from serialization import TASK_PAGE, dump_json
+from bench.seed import seed, reset
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+async def response_model_path(items: list) -> bytes:
+    """What FastAPI does with value returned from endpoint with response_model"""
+    route = next(route for route in main.app.routes if getattr(route, 'path', None) == '/tasks')
+    content = await serialize_response(field=route.response_field, response_content={'items': items, 'next_cursor': None})
+    return JSONResponse(content).body
+
+async def adapter_path(items: list) -> bytes:
+    return dump_json(TASK_PAGE, {'items': items, 'next_cursor': None})
+
+async def adapter_orjson_path(items: list) -> bytes:
+    page = TASK_PAGE.validate_python({'items': items, 'next_cursor': None}, from_attributes=True)
+    return orjson.dumps(TASK_PAGE.dump_python(page, mode='json'))
+
+async def measure(repeat: int, func, *args):
+    """Best time of repeat runs in milliseconds and last result"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = await func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+async def run(args) -> dict:
+    db.configure_engines()
+    try:
+        async with db.AsyncSessionLocal() as instance:
+            if args.reset:
+                await reset(instance)
+                await seed(instance, users=max(1, args.tasks // 10), tasks_per_user=10,
+                           comments_per_task=args.comments_per_task, assignments_per_task=2)
+            ids = list((await instance.execute(db.select(db.TaskT.task_id).order_by(db.TaskT.task_id)
+                                               .limit(args.tasks))).scalars())
+
+            async def load_orm():
+                instance.expunge_all()
+                return await main.find_many_in_db(db.TaskT.task_id, ids, instance, loaders.TASK_DETAIL)
+
+            async def load_rows():
+                return await main.find_task_rows_in_db(ids, instance)
+
+            load_orm_ms, orm_items = await measure(args.repeat, load_orm)
+            load_rows_ms, row_items = await measure(args.repeat, load_rows)
+            paths = {'response_model (orm)': (load_orm_ms, response_model_path, orm_items),
+                     'adapter (orm)': (load_orm_ms, adapter_path, orm_items),
+                     'adapter (rows)': (load_rows_ms, adapter_path, row_items)}
+            if orjson is not None:
+                paths['adapter + orjson (rows)'] = (load_rows_ms, adapter_orjson_path, row_items)
+            results = {}
+            bodies = {}
+            for name, (load_ms, func, items) in paths.items():
+                serialize_ms, body = await measure(args.repeat, func, items)
+                bodies[name] = json.loads(body)
+                results[name] = {'load_ms': load_ms, 'serialize_ms': serialize_ms,
+                                 'total_ms': load_ms + serialize_ms, 'bytes': len(body)}
+            # Every path must produce the same document
+            reference = bodies['response_model (orm)']
+            for name, body in bodies.items():
+                for task in body['items']:
+                    task['comments'].sort(key=lambda comment: comment['comment_id'])
+                    task['assigned_users'].sort(key=lambda user: user['user_id'])
+            assert all(body == reference for body in bodies.values()), 'serialized documents differ'
+    finally:
+        await db.dispose_engines()
+    return {'tasks': len(ids), 'paths': results}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m bench.serialization')
+    parser.add_argument('--tasks', type=int, default=10000)
+    parser.add_argument('--comments-per-task', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=3, help='best of this many runs is reported')
+    parser.add_argument('--reset', action='store_true', help='delete ALL rows and seed --tasks tasks first')
+    parser.add_argument('--output', help='write results to JSON file')
+    args = parser.parse_args()
+    results = asyncio.run(run(args))
+    print(f'{results["tasks"]} tasks')
+    for name, result in results['paths'].items():
+        print(f'{name:<26} load {result["load_ms"]:9.1f} ms  serialize {result["serialize_ms"]:9.1f} ms  '
+              f'total {result["total_ms"]:9.1f} ms  {result["bytes"]} bytes')
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
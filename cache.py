@@ -0,0 +1,225 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+import itertools
+import threading
+import time
+import os
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+# Response cache of task and user reads. Backend is 'memory' (in-process
+# LRU, default) or 'redis' (shared between workers, requires redis package)
+RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'memory')
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 10000))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 300))
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+
+class TTLCache():
+    """Bounded in-process cache. Entries expire after ttl seconds and the least
+    recently used entry is evicted when cache is full"""
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        # Endpoints use caches from event loop only, lock keeps them safe for
+        # callers in other threads
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return cached value or None if key is missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'size': len(self._data), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0}
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Response cache backends. Both store serialized payloads (bytes) and expose
+# the same async interface, so ResponseCache does not depend on backend type.
+# Every delete increments generation of the key. Value loaded from database
+# is stored only if generation didn't change since lookup, so response read
+# before concurrent change is not cached after the change deleted the key
+
+class MemoryBackend():
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Generations of recently deleted keys. Forgotten generation only
+        # makes set() after the lookup skip caching
+        self.generations = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generation = itertools.count(1)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self.cache.get(key)
+
+    async def lookup(self, key: str) -> tuple[Optional[bytes], int]:
+        return self.cache.get(key), self.generations.get(key) or 0
+
+    async def set(self, key: str, value: bytes, generation: Optional[int] = None):
+        # No await between check and write
+        if generation is None or (self.generations.get(key) or 0) == generation:
+            self.cache.set(key, value)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self.cache.invalidate(key)
+            self.generations.set(key, next(self._generation))
+
+    async def evictions(self) -> int:
+        return self.cache.evictions
+
+
+# Value is set only when generation counter of the key is unchanged
+SET_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') == ARGV[2] then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[3])
+end
+return 0
+"""
+
+class RedisBackend():
+    """Backend for any server speaking Redis protocol. Client can be passed
+    explicitly, e.g. fakeredis.FakeAsyncRedis in tests. Generation of key is
+    kept in '<prefix>gen:<key>'"""
+    def __init__(self, client=None, url: str = REDIS_URL, ttl: float = RESPONSE_CACHE_TTL, prefix: str = 'tms:'):
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError('Redis cache backend requires redis package (pip install redis)')
+            client = redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.set_script = client.register_script(SET_SCRIPT)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(self.prefix + key)
+
+    async def lookup(self, key: str) -> tuple[Optional[bytes], int]:
+        value, generation = await self.client.mget(self.prefix + key, f'{self.prefix}gen:{key}')
+        return value, int(generation or 0)
+
+    async def set(self, key: str, value: bytes, generation: Optional[int] = None):
+        if generation is None:
+            await self.client.set(self.prefix + key, value, px=int(self.ttl * 1000))
+        else:
+            await self.set_script(keys=[self.prefix + key, f'{self.prefix}gen:{key}'],
+                                  args=[value, generation, int(self.ttl * 1000)])
+
+    async def delete(self, *keys: str):
+        if keys:
+            async with self.client.pipeline(transaction=True) as pipeline:
+                pipeline.delete(*(self.prefix + key for key in keys))
+                for key in keys:
+                    # Generation outlives every lookup which could have seen the old one
+                    pipeline.incr(f'{self.prefix}gen:{key}')
+                    pipeline.pexpire(f'{self.prefix}gen:{key}', int(self.ttl * 1000))
+                await pipeline.execute()
+
+    async def evictions(self) -> Optional[int]:
+        # Evictions are counted by server for all clients. Some Redis
+        # compatible servers do not implement INFO
+        try:
+            return int((await self.client.info('stats')).get('evicted_keys', 0))
+        except Exception:
+            return None
+
+
+class ResponseCache():
+    """Read-through cache of serialized responses. Write endpoints must delete
+    keys of everything they change"""
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        value = await self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def lookup(self, key: str) -> tuple[Optional[bytes], int]:
+        """Return cached value and generation of key. Pass the generation
+        to set() when value is loaded on miss"""
+        value, generation = await self.backend.lookup(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value, generation
+
+    async def set(self, key: str, value: bytes, generation: Optional[int] = None):
+        """Store value. With generation from lookup() value is not stored
+        when key was invalidated since then"""
+        await self.backend.set(key, value, generation)
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[bytes]]) -> bytes:
+        value, generation = await self.lookup(key)
+        if value is not None:
+            return value
+        # Exceptions raised by loader (e.g. 404) are not cached
+        value = await loader()
+        await self.set(key, value, generation)
+        return value
+
+    async def invalidate(self, *keys: str):
+        await self.backend.delete(*keys)
+
+    async def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'backend': type(self.backend).__name__, 'hits': self.hits, 'misses': self.misses,
+                'evictions': await self.backend.evictions(),
+                'hit_ratio': self.hits / lookups if lookups else 0.0}
+
+
+def task_key(task_id: int) -> str:
+    return f'task:{task_id}'
+
+def user_key(user_id: int) -> str:
+    return f'user:{user_id}'
+
+def create_response_cache(backend: str = RESPONSE_CACHE_BACKEND) -> ResponseCache:
+    if backend == 'redis':
+        return ResponseCache(RedisBackend())
+    if backend == 'memory':
+        return ResponseCache(MemoryBackend())
+    raise ValueError(f'Unknown response cache backend: {backend}')
+
+response_cache = create_response_cache()
@@ -0,0 +1,53 @@
+from sqlalchemy import union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+import asyncio
+import logging
+import os
+from dotenv import load_dotenv
+import db
+
+load_dotenv(override=True)
+# Task counters (task_status_totals, user_task_counts) are changed by
+# triggers through task_count_deltas, so concurrent writers never lock shared
+# counter rows. Every worker moves deltas to counters this often (seconds),
+# only one worker at a time does the work
+TASK_COUNTS_COMPACT_INTERVAL = float(os.getenv('TASK_COUNTS_COMPACT_INTERVAL', 5))
+
+log = logging.getLogger('tms.counters')
+
+
+def status_totals_query():
+    """Select (status, count) of all tasks, pending deltas included"""
+    totals, deltas = db.task_status_totals.c, db.task_count_deltas.c
+    counts = union_all(db.select(totals.status, totals.count),
+                       db.select(deltas.status, deltas.delta).where(deltas.user_id.is_(None))).subquery()
+    return db.select(counts.c.status, db.func.sum(counts.c.count).label('count')).group_by(counts.c.status)
+
+def user_counts_query(user_id: int, role: Optional[str] = None):
+    """Select (role, status, count) of tasks of user, pending deltas included"""
+    counters, deltas = db.user_task_counts.c, db.task_count_deltas.c
+    counts = union_all(db.select(counters.role, counters.status, counters.count).where(counters.user_id == user_id),
+                       db.select(deltas.role, deltas.status, deltas.delta).where(deltas.user_id == user_id)).subquery()
+    query = db.select(counts.c.role, counts.c.status, db.func.sum(counts.c.count).label('count')) \
+              .group_by(counts.c.role, counts.c.status)
+    if role is not None:
+        query = query.where(counts.c.role == role)
+    return query
+
+async def compact() -> int:
+    """Move pending deltas to counters, returns number of changed counters"""
+    async with db.AsyncSessionLocal() as instance:
+        moved = (await instance.execute(db.select(db.func.task_counts_compact()))).scalar()
+        await instance.commit()
+    return moved
+
+async def keep_compacted():
+    """Compact deltas every TASK_COUNTS_COMPACT_INTERVAL seconds, runs until
+    cancelled"""
+    while True:
+        try:
+            await compact()
+        except Exception as exc:
+            log.warning('Compaction of task counters failed: %s', exc)
+        await asyncio.sleep(TASK_COUNTS_COMPACT_INTERVAL)
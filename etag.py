@@ -0,0 +1,29 @@
+from fastapi.responses import Response
+from typing import Iterable, Optional
+import hashlib
+
+# ETags are built from row versions (db.TaskT.version, db.UserT.version), so
+# comparing them never requires loading or serializing the object
+
+
+def make_etag(key: str, version: int) -> str:
+    """ETag of single object, key is response cache key e.g. 'task:1'"""
+    return f'"{key}.{version}"'
+
+def page_etag(kind: str, versions: Iterable[tuple[int, int]], next_cursor: Optional[str]) -> str:
+    """ETag of one page built from (id, version) pairs of its rows"""
+    digest = hashlib.sha1(repr((list(versions), next_cursor)).encode()).hexdigest()
+    return f'"{kind}.{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of If-None-Match header against current ETag"""
+    if if_none_match is None:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*' or tag.removeprefix('W/') == etag:
+            return True
+    return False
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={'ETag': etag})
@@ -0,0 +1,259 @@
+from fastapi import HTTPException
+from sqlalchemy import Integer, String, literal
+from sqlalchemy.dialects.postgresql import array
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Literal, Optional
+import asyncio
+import datetime
+import json
+import logging
+import time
+import asyncpg
+import os
+from dotenv import load_dotenv
+import db
+
+load_dotenv(override=True)
+# Change feed of tasks. Write endpoints record events in task_events table in
+# the same transaction as the change and insert trigger sends NOTIFY with the
+# event ID. Every worker with subscribers keeps one LISTEN connection and
+# pushes events to its clients (GET /events, server-sent events).
+# Delivery is at least once, clients skip event IDs they already have
+EVENTS_HEARTBEAT = float(os.getenv('EVENTS_HEARTBEAT', 15))
+EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', 1000))
+EVENTS_REPLAY_LIMIT = int(os.getenv('EVENTS_REPLAY_LIMIT', 1000))
+EVENTS_RETENTION_HOURS = float(os.getenv('EVENTS_RETENTION_HOURS', 24))
+
+CHANNEL = 'task_events'
+PURGE_INTERVAL = 3600
+
+log = logging.getLogger('tms.events')
+
+EventKind = Literal['task_added', 'task_updated', 'task_deleted', 'assignees_changed',
+                    'comment_added', 'comment_updated', 'comment_deleted']
+
+EVENT_COLUMNS = (db.task_events.c.event_id, db.task_events.c.task_id, db.task_events.c.kind,
+                 db.task_events.c.data, db.task_events.c.created_at)
+
+
+async def record(instance: AsyncSession, kind: EventKind, task_ids, data: Optional[dict] = None, user_ids=()):
+    """Record event of every task in task_ids in current transaction. Event goes
+    to owner and assignees of the task and to user_ids (e.g. users removed from
+    it), so record it while the task and its assignments still exist"""
+    task_ids = set(task_ids)
+    if not task_ids:
+        return
+    # Pending ORM changes (new comment, assignment) must be visible to audience query
+    await instance.flush()
+    assoc = db.user_task_association
+    assignees = db.select(db.func.array_agg(assoc.c.user_id)).where(assoc.c.task_id == db.TaskT.task_id) \
+                  .scalar_subquery()
+    # array_cat() of NULL (no assignees) and array returns the array
+    audience = db.func.array_cat(assignees, array([db.TaskT.owner_id, *(literal(user_id, Integer) for user_id in user_ids)]))
+    rows = db.select(db.TaskT.task_id, literal(kind, String), literal(data, db.JSON) if data is not None else db.null(),
+                     audience).where(db.TaskT.task_id.in_(task_ids))
+    await instance.execute(db.insert(db.task_events).from_select(['task_id', 'kind', 'data', 'user_ids'], rows))
+
+def to_dict(row) -> dict:
+    return {'event_id': row.event_id, 'task_id': row.task_id, 'kind': row.kind, 'data': row.data,
+            'created_at': row.created_at.isoformat()}
+
+def format_event(event: dict) -> str:
+    return f'id: {event["event_id"]}\nevent: {event["kind"]}\ndata: {json.dumps(event)}\n\n'
+
+
+class Subscription():
+    """Events of one client waiting to be sent. Subscription is closed when the
+    client doesn't keep up (queue is full) or listener connection is lost, the
+    client then reconnects and resumes from its last event ID"""
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(EVENTS_QUEUE_SIZE)
+        self.closed = False
+
+    def push(self, event: dict):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.close()
+
+    def close(self):
+        self.closed = True
+        # Wakes up waiting stream, full queue wakes it anyway
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+
+class EventBroker():
+    """Fans out events announced by NOTIFY to subscriptions of this worker.
+    Listener is started by the first connect() and runs until stop()"""
+    def __init__(self):
+        self._subscriptions: dict[int, set] = {}
+        self._pending: list = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._connected: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def connect(self):
+        """Start listener if it isn't running and wait until it is connected.
+        Raises HTTPException 503 when database cannot be reached"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._connected = asyncio.Event()
+            self._task = asyncio.create_task(self._listen())
+        try:
+            await asyncio.wait_for(self._connected.wait(), db.DATABASE_CONNECT_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail='Change feed is not available')
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """Register subscription. Subscription made while listener is
+        disconnected is closed at once, the client reconnects"""
+        subscription = Subscription(user_id)
+        if self._connected is None or not self._connected.is_set():
+            subscription.close()
+            return subscription
+        self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.user_id]
+
+    def subscribers(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._close_all()
+
+    def _close_all(self):
+        for subscriptions in list(self._subscriptions.values()):
+            for subscription in list(subscriptions):
+                subscription.close()
+        self._subscriptions.clear()
+
+    def _notified(self, connection, pid, channel, payload):
+        self._pending.append(int(payload))
+        self._wakeup.set()
+
+    async def _listen(self):
+        """Keep LISTEN connection open, reconnect with growing delay. Events
+        may be missed while disconnected, so subscriptions are closed and
+        clients resume from the table"""
+        dsn = db.ASYNC_DATABASE_URL.set(drivername='postgresql').render_as_string(hide_password=False)
+        delay = 1
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn, timeout=db.DATABASE_CONNECT_TIMEOUT)
+                await connection.add_listener(CHANNEL, self._notified)
+                self._connected.set()
+                delay = 1
+                await self._dispatch_loop(connection)
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError,
+                    db.DBAPIError) as exc:
+                log.warning('Change feed listener disconnected: %s', exc)
+            finally:
+                self._connected.clear()
+                self._close_all()
+                if connection is not None:
+                    connection.terminate()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    async def _dispatch_loop(self, connection):
+        purged = 0.0
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Idle connection which was dropped would never be noticed otherwise
+                await connection.execute('SELECT 1', timeout=db.DATABASE_CONNECT_TIMEOUT)
+            self._wakeup.clear()
+            if self._pending:
+                event_ids, self._pending = self._pending, []
+                await self._dispatch(event_ids)
+            if time.monotonic() - purged > PURGE_INTERVAL:
+                await purge()
+                purged = time.monotonic()
+
+    async def _dispatch(self, event_ids: list):
+        """Read announced events with one query and push them to subscribers"""
+        query = db.select(*EVENT_COLUMNS, db.task_events.c.user_ids) \
+                  .where(db.task_events.c.event_id.in_(event_ids)).order_by(db.task_events.c.event_id)
+        async with db.AsyncSessionLocal() as instance:
+            rows = (await instance.execute(query)).all()
+        for row in rows:
+            event = to_dict(row)
+            for user_id in set(row.user_ids):
+                for subscription in list(self._subscriptions.get(user_id, ())):
+                    subscription.push(event)
+
+broker = EventBroker()
+
+
+async def purge():
+    """Delete events older than EVENTS_RETENTION_HOURS"""
+    cutoff = db.func.now() - datetime.timedelta(hours=EVENTS_RETENTION_HOURS)
+    async with db.AsyncSessionLocal() as instance:
+        await instance.execute(db.delete(db.task_events).where(db.task_events.c.created_at < cutoff))
+        await instance.commit()
+
+async def replay(user_id: int, last_event_id: int) -> tuple[list, Optional[int]]:
+    """Events of user recorded after last_event_id, oldest first. When they
+    cannot be replayed (some were purged already or there are more than
+    EVENTS_REPLAY_LIMIT) returns no events and ID of the latest event instead,
+    the client should reload its data"""
+    events = db.task_events.c
+    async with db.AsyncSessionLocal() as instance:
+        oldest, latest = (await instance.execute(db.select(db.func.min(events.event_id),
+                                                           db.func.max(events.event_id)))).one()
+        if oldest is not None and oldest > last_event_id + 1:
+            return [], latest
+        query = db.select(*EVENT_COLUMNS).where(events.event_id > last_event_id, events.user_ids.contains([user_id])) \
+                  .order_by(events.event_id).limit(EVENTS_REPLAY_LIMIT + 1)
+        rows = (await instance.execute(query)).all()
+    if len(rows) > EVENTS_REPLAY_LIMIT:
+        return [], latest
+    return [to_dict(row) for row in rows], None
+
+async def stream(user_id: int, last_event_id: Optional[int]):
+    """Server-sent events of user. Events recorded after last_event_id are
+    replayed first. 'reset' event tells the client that events were lost and
+    it should reload tasks. Subscription is registered on the first iteration,
+    so a stream which is never started leaves nothing behind"""
+    subscription = broker.subscribe(user_id)
+    try:
+        replayed = set()
+        if last_event_id is not None:
+            events, reset_id = await replay(user_id, last_event_id)
+            if reset_id is not None:
+                yield f'id: {reset_id}\nevent: reset\ndata: {{}}\n\n'
+            for event in events:
+                replayed.add(event['event_id'])
+                yield format_event(event)
+        while not subscription.closed:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Comment line keeps proxies from closing idle connection
+                yield ': keepalive\n\n'
+                continue
+            if event is not None and event['event_id'] not in replayed:
+                yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,96 @@
+from typing import AsyncIterator, Literal, Optional
+import datetime
+import csv
+import io
+import json
+import db
+import events
+import loaders
+from schemas import TaskExport, TaskTombstone
+
+ExportFormat = Literal['ndjson', 'csv']
+
+# Number of tasks fetched from server-side cursor at once. Comments and
+# assigned users are loaded with one query per batch
+EXPORT_BATCH_SIZE = 1000
+
+CSV_COLUMNS = ['task_id', 'owner_id', 'title', 'description', 'start_date', 'end_date',
+               'status', 'updated_at', 'assigned_user_ids', 'comments', 'deleted_at']
+
+# Deleted tasks are exported from task_deleted events, which are kept for
+# EVENTS_RETENTION_HOURS. Older updated_since needs full export
+TOMBSTONE_RETENTION = datetime.timedelta(hours=events.EVENTS_RETENTION_HOURS)
+
+# Oldest start of open transactions, including the one running this query.
+# Transaction which is still open writes updated_at not older than its own
+# start, so its changes are exported by the next export from this watermark.
+# Role of application must see other sessions in pg_stat_activity (sessions
+# of the same role or pg_read_all_stats)
+WATERMARK_QUERY = db.text('SELECT min(xact_start) FROM pg_stat_activity WHERE datname = current_database()')
+
+MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def export_query(updated_since: Optional[datetime.datetime]):
+    query = db.select(db.TaskT).options(*loaders.TASK_DETAIL).order_by(db.TaskT.task_id)
+    if updated_since is not None:
+        query = query.where(db.TaskT.updated_at >= updated_since)
+    return query.execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+def tombstone_query(updated_since: datetime.datetime):
+    task_events = db.task_events.c
+    return db.select(task_events.task_id, db.func.max(task_events.created_at).label('deleted_at')) \
+             .where(task_events.kind == 'task_deleted', task_events.created_at >= updated_since) \
+             .group_by(task_events.task_id).order_by(task_events.task_id) \
+             .execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+async def export_watermark() -> datetime.datetime:
+    """Database time from which the next incremental export starts. Read
+    before snapshot of export is taken, see stream_tasks()"""
+    async with db.AsyncSessionLocal() as instance:
+        return (await instance.execute(WATERMARK_QUERY)).scalar()
+
+def _csv_line(row: list) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(row)
+    return buffer.getvalue()
+
+def _csv_row(task: TaskExport) -> list:
+    data = task.model_dump(mode='json')
+    data['assigned_user_ids'] = ';'.join(str(user['user_id']) for user in data['assigned_users'])
+    data['comments'] = json.dumps(data['comments'])
+    return [data.get(column) for column in CSV_COLUMNS]
+
+def _csv_tombstone_row(tombstone: TaskTombstone) -> list:
+    return [tombstone.task_id] + [''] * (len(CSV_COLUMNS) - 2) + [tombstone.deleted_at.isoformat()]
+
+def _format(export_format: ExportFormat, item: TaskExport | TaskTombstone) -> str:
+    if export_format == 'ndjson':
+        return item.model_dump_json() + '\n'
+    return _csv_line(_csv_row(item) if isinstance(item, TaskExport) else _csv_tombstone_row(item))
+
+async def stream_tasks(export_format: ExportFormat,
+                       updated_since: Optional[datetime.datetime] = None) -> AsyncIterator[str]:
+    """Yield exported tasks batch by batch. Tasks are read with server-side
+    cursor and session keeps only weak references to loaded rows, so memory
+    usage does not depend on number of exported tasks. Incremental export
+    ends with tombstones of tasks deleted since updated_since"""
+    # Own session, because dependency sessions are closed before response body is streamed
+    async with db.AsyncSessionLocal() as instance:
+        # Tasks and tombstones are read from one snapshot, taken after watermark
+        await instance.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+        # Export of all tasks is one long running statement
+        if db.DATABASE_STATEMENT_TIMEOUT:
+            await instance.execute(db.text('SET LOCAL statement_timeout = 0'))
+        if export_format == 'csv':
+            yield _csv_line(CSV_COLUMNS)
+        result = await instance.stream(export_query(updated_since))
+        async for partition in result.scalars().partitions():
+            yield ''.join(_format(export_format, TaskExport.model_validate(task, from_attributes=True))
+                          for task in partition)
+        if updated_since is None:
+            return
+        result = await instance.stream(tombstone_query(updated_since))
+        async for partition in result.partitions():
+            yield ''.join(_format(export_format, TaskTombstone.model_validate(row, from_attributes=True))
+                          for row in partition)
@@ -0,0 +1,54 @@
+from sqlalchemy.orm import selectinload, raiseload, load_only
+import db
+
+# Loading strategies used by endpoints. Relationships in db.py are lazy by
+# default, so every endpoint declares here exactly what it serializes.
+# Everything that is not listed raises on access (raiseload) instead of
+# silently firing one more query per row.
+
+# Columns needed by schemas.UserWithID. Password hash is loaded only for login
+_USER_COLUMNS = (db.UserT.user_id, db.UserT.username, db.UserT.email)
+
+# Existence checks and foreign key validation, only primary key is loaded
+USER_REF = (load_only(db.UserT.user_id, raiseload=True), raiseload('*'))
+TASK_REF = (load_only(db.TaskT.task_id, db.TaskT.owner_id, raiseload=True), raiseload('*'))
+
+# Conditional GET, only row version is needed to build ETag
+USER_VERSION = (load_only(db.UserT.user_id, db.UserT.version, raiseload=True), raiseload('*'))
+TASK_VERSION = (load_only(db.TaskT.task_id, db.TaskT.version, raiseload=True), raiseload('*'))
+
+# Authenticated user returned by security.get_current_user
+USER_PRINCIPAL = (load_only(*_USER_COLUMNS, raiseload=True), raiseload('*'))
+# User loaded in /token to verify password
+# and to issue token with user claims
+USER_CREDENTIALS = (load_only(*_USER_COLUMNS, db.UserT.password, db.UserT.role, db.UserT.token_version,
+                              raiseload=True), raiseload('*'))
+# schemas.UserWithID
+USER_SUMMARY = USER_PRINCIPAL
+
+# schemas.User, tasks are serialized only by their IDs
+USER_DETAIL = (
+    load_only(*_USER_COLUMNS, db.UserT.version, raiseload=True),
+    selectinload(db.UserT.owned_tasks).options(load_only(db.TaskT.task_id, db.TaskT.owner_id), raiseload('*')),
+    selectinload(db.UserT.assigned_tasks).options(load_only(db.TaskT.task_id), raiseload('*')),
+    raiseload('*'),
+)
+
+# schemas.Task, comments and assigned users are loaded with one query each
+# for the whole page instead of one query per task
+TASK_DETAIL = (
+    selectinload(db.TaskT.comments).options(raiseload('*')),
+    selectinload(db.TaskT.assigned_users).options(load_only(*_USER_COLUMNS, raiseload=True), raiseload('*')),
+    raiseload('*'),
+)
+
+# schemas.Comment
+COMMENT_DETAIL = (raiseload('*'),)
+
+# Columns of schemas.Task, comments and assigned users read by column-only
+# queries in main.find_task_rows_in_db()
+TASK_COLUMNS = (db.TaskT.task_id, db.TaskT.owner_id, db.TaskT.title, db.TaskT.description,
+                db.TaskT.start_date, db.TaskT.end_date, db.TaskT.status)
+COMMENT_COLUMNS = (db.CommentT.task_id, db.CommentT.comment_id, db.CommentT.user_id,
+                   db.CommentT.timestamp, db.CommentT.comment)
+
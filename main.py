@@ -1,189 +1,834 @@
-from fastapi import FastAPI, HTTPException, Depends, APIRouter
+from fastapi import FastAPI, HTTPException, Depends, APIRouter, Query, Body, Header, Request
+from fastapi.responses import StreamingResponse, Response, PlainTextResponse, JSONResponse
 from pydantic import BaseModel, Field, model_serializer
-from typing import Optional, List, Annotated
+from typing import Optional, List, Annotated, Union
+from contextlib import asynccontextmanager
 import datetime
-from sqlalchemy.orm import Session
+import asyncio
+import logging
+import os
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 import db
-from pwhshr import Password, PasswordHash
+from pwhshr import Password, PasswordHash, shutdown_pool
 from schemas import *
 import security as sc
+import loaders
+import authz
+from pagination import paginate, paginate_keyset, SortOrder, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+import export
+import search
+import assignments
+import events
+import metrics
+import ratelimit
+import revocations
+import counters
+from serialization import json_response, TASK_BRIEF, TASK_BRIEF_PAGE, TASK_PAGE, TASK_SEARCH_PAGE, USER_PAGE
+from cache import response_cache, task_key, user_key
+from etag import make_etag, page_etag, etag_matches, not_modified
 
-def find_user_in_db(user_id: int, instance: Session) -> User:
-    """Check if user with user_id exist in database and return user. 
-    If user doesn't exist then raise HTTPException"""
-    user = instance.execute(db.select(db.UserT).where(db.UserT.user_id == user_id)).scalar()
+load_dotenv(override=True)
+# Maximum number of items accepted by one bulk request
+MAX_BULK_ITEMS = 5000
+# Users owning more tasks are deleted in background, USER_PURGE_BATCH tasks
+# per transaction (see purge_user())
+USER_PURGE_THRESHOLD = int(os.getenv('USER_PURGE_THRESHOLD', 1000))
+USER_PURGE_BATCH = int(os.getenv('USER_PURGE_BATCH', 500))
+
+log = logging.getLogger('tms.purge')
+
+async def find_user_in_db(user_id: int, instance: AsyncSession, options: tuple = loaders.USER_REF) -> User:
+    """Check if user with user_id exist in database and return user loaded with
+    given loader options. If user doesn't exist then raise HTTPException"""
+    query = db.select(db.UserT).where(db.UserT.user_id == user_id, db.UserT.deleted_at.is_(None)).options(*options)
+    user = (await instance.execute(query.execution_options(populate_existing=True))).scalar()
     if user is None:
         raise HTTPException(status_code=404, detail='User not found')
     return user
 
-def find_task_in_db(task_id: int, instance: Session) -> Task:
-    """Check if task with task_id exist in database and return task.
-    If task doesn't exist then raise HTTPException"""
-    task = instance.execute(db.select(db.TaskT).where(db.TaskT.task_id == task_id)).scalar()
+async def find_task_in_db(task_id: int, instance: AsyncSession, options: tuple = loaders.TASK_REF) -> Task:
+    """Check if task with task_id exist in database and return task loaded with
+    given loader options. If task doesn't exist then raise HTTPException"""
+    query = db.select(db.TaskT).where(db.TaskT.task_id == task_id).options(*options)
+    task = (await instance.execute(query.execution_options(populate_existing=True))).scalar()
     if task is None:
         raise HTTPException(status_code=404, detail='Task not found')
     return task
 
-def find_comment_in_db(comment_id: int, instance: Session) -> Comment:
+async def find_comment_in_db(comment_id: int, instance: AsyncSession, options: tuple = loaders.COMMENT_DETAIL) -> Comment:
     """Check if comment with comment_id exist in database and return comment.
     If comment doesn't exist then raise HTTPException"""
-    comment = instance.execute(db.select(db.CommentT).where(db.CommentT.comment_id == comment_id)).scalar()
+    query = db.select(db.CommentT).where(db.CommentT.comment_id == comment_id).options(*options)
+    comment = (await instance.execute(query.execution_options(populate_existing=True))).scalar()
     if comment is None:
         raise HTTPException(status_code=404, detail='Comment not found')
     return comment
 
-app = FastAPI()
-auth = APIRouter(dependencies=[Depends(sc.get_current_user)])
+async def find_existing_in_db(column, values: set, instance: AsyncSession, *criteria) -> set:
+    """Return those values which exist in given column (in rows matching
+    criteria), checked with one query"""
+    if not values:
+        return set()
+    return set((await instance.execute(db.select(column).where(column.in_(values), *criteria))).scalars())
+
+async def find_assignments_in_db(pairs: set, instance: AsyncSession) -> set:
+    """Return those (task_id, user_id) pairs which are already assigned"""
+    if not pairs:
+        return set()
+    assoc = db.user_task_association
+    query = db.select(assoc.c.task_id, assoc.c.user_id).where(
+        db.tuple_(assoc.c.task_id, assoc.c.user_id).in_(pairs))
+    return set((await instance.execute(query)).tuples())
+
+async def lock_tasks(criteria, instance: AsyncSession) -> set:
+    """Lock tasks matching criteria in ID order and return their IDs. Must
+    precede changes of assignments: assignment trigger locks the task FOR
+    SHARE and two transactions upgrading it in mark_changed() would deadlock.
+    Task read after the lock can't be changed by others until commit"""
+    query = db.select(db.TaskT.task_id).where(criteria).order_by(db.TaskT.task_id).with_for_update(key_share=True)
+    return set((await instance.execute(query)).scalars())
+
+async def find_many_in_db(key, ids: List[int], instance: AsyncSession, options: tuple) -> list:
+    """Load objects by primary key with given loader options, in the order of ids"""
+    query = db.select(key.class_).where(key.in_(ids)).options(*options)
+    loaded = {getattr(row, key.key): row
+              for row in (await instance.execute(query.execution_options(populate_existing=True))).scalars()}
+    return [loaded[row_id] for row_id in ids if row_id in loaded]
+
+async def find_task_rows_in_db(ids: List[int], instance: AsyncSession) -> List[dict]:
+    """Load tasks with comments and assigned users as plain dicts, in the order
+    of ids. Uses column-only queries, so no ORM objects are created"""
+    if not ids:
+        return []
+    query = db.select(*loaders.TASK_COLUMNS).where(db.TaskT.task_id.in_(ids))
+    tasks = {row['task_id']: {**row, 'comments': [], 'assigned_users': []}
+             for row in (await instance.execute(query)).mappings()}
+    query = db.select(*loaders.COMMENT_COLUMNS).where(db.CommentT.task_id.in_(ids)).order_by(db.CommentT.comment_id)
+    for row in (await instance.execute(query)).mappings():
+        tasks[row['task_id']]['comments'].append(dict(row))
+    assoc = db.user_task_association
+    query = db.select(assoc.c.task_id, db.UserT.user_id, db.UserT.username, db.UserT.email) \
+              .join(db.UserT, db.UserT.user_id == assoc.c.user_id).where(assoc.c.task_id.in_(ids))
+    for row in (await instance.execute(query)).mappings():
+        tasks[row['task_id']]['assigned_users'].append(dict(row))
+    return [tasks[task_id] for task_id in ids if task_id in tasks]
+
+async def find_task_briefs_in_db(ids: List[int], instance: AsyncSession) -> List[dict]:
+    """Load tasks with number of comments and assignees (schemas.TaskBrief) and
+    version as plain dicts, in the order of ids. Counts come from correlated
+    subqueries of one query, served by indexes on task_id"""
+    if not ids:
+        return []
+    assoc = db.user_task_association
+    comments = db.select(db.func.count()).where(db.CommentT.task_id == db.TaskT.task_id)
+    last_comment = db.select(db.func.max(db.CommentT.timestamp)).where(db.CommentT.task_id == db.TaskT.task_id)
+    assignees = db.select(db.func.count()).where(assoc.c.task_id == db.TaskT.task_id)
+    query = db.select(*loaders.TASK_COLUMNS, db.TaskT.version,
+                      comments.scalar_subquery().label('comment_count'),
+                      last_comment.scalar_subquery().label('last_comment_at'),
+                      assignees.scalar_subquery().label('assignee_count')).where(db.TaskT.task_id.in_(ids))
+    tasks = {row['task_id']: dict(row) for row in (await instance.execute(query)).mappings()}
+    return [tasks[task_id] for task_id in ids if task_id in tasks]
+
+async def insert_many(entity, id_column, rows: List[dict], instance: AsyncSession) -> List[int]:
+    """Insert rows with multi-row INSERT and return generated IDs in the same order"""
+    if not rows:
+        return []
+    query = db.insert(entity).returning(id_column, sort_by_parameter_order=True)
+    return list((await instance.execute(query, rows)).scalars())
+
+async def mark_changed(instance: AsyncSession, task_ids=(), user_ids=()):
+    """Bump versions (ETags) of tasks and users whose serialized form changes,
+    in the current transaction. Rows are remembered, so commit_changes() can
+    drop their cached responses"""
+    task_ids, user_ids = set(task_ids), set(user_ids)
+    if task_ids:
+        await instance.execute(db.update(db.TaskT).where(db.TaskT.task_id.in_(task_ids))
+                               .values(version=db.TaskT.version + 1, updated_at=db.func.now())
+                               .execution_options(synchronize_session=False))
+    if user_ids:
+        await instance.execute(db.update(db.UserT).where(db.UserT.user_id.in_(user_ids))
+                               .values(version=db.UserT.version + 1)
+                               .execution_options(synchronize_session=False))
+    changed_tasks, changed_users = instance.info.setdefault('changed', (set(), set()))
+    changed_tasks.update(task_ids)
+    changed_users.update(user_ids)
+
+async def commit_changes(instance: AsyncSession):
+    """Commit and drop cached responses of rows passed to mark_changed()"""
+    await instance.commit()
+    task_ids, user_ids = instance.info.pop('changed', (set(), set()))
+    keys = [*map(task_key, task_ids), *map(user_key, user_ids)]
+    await response_cache.invalidate(*keys)
+    if db.replica_engines and keys:
+        # Lagging replica can still return old rows, which would be cached again
+        run_in_background(invalidate_later(keys, db.DATABASE_REPLICA_LAG))
+
+# References to running background tasks, so they are not garbage collected
+_background_tasks = set()
+
+def run_in_background(coroutine):
+    task = asyncio.create_task(coroutine)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def invalidate_later(keys: list, delay: float):
+    await asyncio.sleep(delay)
+    await response_cache.invalidate(*keys)
+
+async def cached_response(key: str, model, if_none_match: Optional[str], find_version, load) -> Response:
+    """Return cached JSON payload with ETag. Cache entry keeps ETag in front of
+    payload, so If-None-Match is answered from cache. On miss only version is
+    read with find_version() and object is loaded with load() and serialized
+    with given pydantic model only when client copy is outdated"""
+    entry, generation = await response_cache.lookup(key)
+    if entry is None:
+        etag = make_etag(key, (await find_version()).version)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        obj = await load()
+        payload = model.model_validate(obj, from_attributes=True).model_dump_json().encode()
+        entry = make_etag(key, obj.version).encode() + b'\n' + payload
+        # Not cached when the object changed meanwhile, response is still correct for this read
+        await response_cache.set(key, entry, generation)
+    etag, payload = entry.split(b'\n', 1)
+    etag = etag.decode()
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    return Response(content=payload, media_type='application/json', headers={'ETag': etag})
 
-@app.post('/token')
-async def login_for_access_token(form_data: Annotated[sc.OAuth2PasswordRequestForm, Depends()],
-                                 instance: Session = Depends(db.get_session)) -> sc.Token:
-    result = sc.login_for_access_token_function(form_data, instance)
+async def versioned_page(instance: AsyncSession, query, key, load, adapter, limit: int, cursor: Optional[str],
+                         order: SortOrder, if_none_match: Optional[str], kind: Optional[str] = None) -> Response:
+    """Paginate query which loads only primary keys and versions. If ETag of the
+    page matches If-None-Match then 304 is returned, otherwise rows of the page
+    are loaded with load(ids) and serialized with adapter. Different
+    representations of the same rows need different ETag kind"""
+    rows, next_cursor = await paginate(instance, query, key, limit, cursor, order)
+    ids = [getattr(row, key.key) for row in rows]
+    etag = page_etag(kind or key.class_.__tablename__, [(row_id, row.version) for row_id, row in zip(ids, rows)],
+                     next_cursor)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    return json_response(adapter, {'items': await load(ids), 'next_cursor': next_cursor}, headers={'ETag': etag})
+
+def overdue_clause():
+    """Tasks which are not finished and their end date has passed"""
+    return db.and_(db.TaskT.status.in_(db.ACTIVE_TASK_STATUSES), db.TaskT.end_date < db.func.current_date())
+
+def bulk_result(results: List[BulkItemResult], valid: List[int], ids: List[Optional[int]]) -> BulkResult:
+    """Fill IDs of inserted items into per-item results"""
+    for index, row_id in zip(valid, ids):
+        results[index].id = row_id
+    return BulkResult(created=len(valid), results=results)
+
+# Routes are registered on routers and added to application in create_app()
+public = APIRouter()
+# Rate limit is checked first, rejected requests don't decode token
+auth = APIRouter(dependencies=[Depends(ratelimit.limit_token), Depends(sc.get_current_user)])
+
+@public.post('/token')
+async def login_for_access_token(request: Request, form_data: Annotated[sc.OAuth2PasswordRequestForm, Depends()],
+                                 instance: AsyncSession = Depends(db.get_async_session)) -> sc.Token:
+    # Excess attempts are rejected before user lookup and bcrypt
+    await ratelimit.limit_login(request, form_data.username)
+    result = await sc.login_for_access_token_function(form_data, instance)
     return result
 
+@auth.post('/token/revoke', status_code=204)
+async def revoke_access_token(current_user: Annotated[sc.Principal, Depends(sc.get_current_user)],
+                              everywhere: bool = False, instance: AsyncSession = Depends(db.get_async_session)):
+    """Log out. Revokes token of this request, with everywhere all tokens
+    issued to the user"""
+    if everywhere:
+        await sc.revoke_user_tokens(current_user.user_id, instance)
+    else:
+        await sc.revoke_token(current_user, instance)
+    await instance.commit()
+    return Response(status_code=204)
+
+@public.get('/metrics', response_class=PlainTextResponse)
+async def get_metrics():
+    """Request, database and bcrypt metrics in Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
+
+@auth.get('/events')
+async def stream_events(current_user: Annotated[sc.Principal, Depends(sc.get_current_user)],
+                        last_event_id: Optional[int] = Header(None),
+                        instance: AsyncSession = Depends(db.get_async_session)):
+    """Server-sent events about tasks the user owns or is assigned to: new,
+    updated and deleted tasks, comments and assignment changes. Reconnecting
+    client sends Last-Event-ID header and gets events it missed"""
+    # Session was used only for authentication, it would hold pooled
+    # connection for the whole stream
+    await instance.close()
+    await events.broker.connect()
+    return StreamingResponse(events.stream(current_user.user_id, last_event_id), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @auth.get('/users/me', response_model=User)
-async def get_me(current_user: Annotated[User, Depends(sc.get_current_user)]):
-    return current_user
-
-@auth.get('/users', response_model=List[User])
-def get_users(instance: Session = Depends(db.get_session)):
-    """Return all items from Users table"""
-    users = instance.execute(db.select(db.UserT)).unique().scalars()
-    result = [user for user in users]
-    return result
+async def get_me(current_user: Annotated[sc.Principal, Depends(sc.get_current_user)],
+                 if_none_match: Optional[str] = Header(None),
+                 instance: AsyncSession = Depends(db.get_read_session)):
+    # current_user carries only basic columns, tasks are loaded here
+    return await get_user(current_user.user_id, if_none_match=if_none_match, instance=instance)
+
+@auth.get('/users', response_model=UserPage)
+async def get_users(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                    cursor: Optional[str] = None,
+                    order: SortOrder = 'asc',
+                    if_none_match: Optional[str] = Header(None),
+                    instance: AsyncSession = Depends(db.get_read_session)):
+    """Return one page of users ordered by user ID. Pass next_cursor from
+    previous response to get the next page"""
+    query = db.select(db.UserT).where(db.UserT.deleted_at.is_(None)).options(*loaders.USER_VERSION)
+    return await versioned_page(instance, query, db.UserT.user_id,
+                                lambda ids: find_many_in_db(db.UserT.user_id, ids, instance, loaders.USER_DETAIL),
+                                USER_PAGE, limit, cursor, order, if_none_match)
 
 @auth.get('/users/{user_id}', response_model=User)
-def get_user(user_id: int, instance: Session = Depends(db.get_session)):
-    """Find user by passing user_id"""
-    user = find_user_in_db(user_id, instance=instance)
-    return user
+async def get_user(user_id: int, if_none_match: Optional[str] = Header(None),
+                   instance: AsyncSession = Depends(db.get_read_session)):
+    """Find user by passing user_id. Response is served from cache, 304 is
+    returned when If-None-Match matches ETag"""
+    return await cached_response(user_key(user_id), User, if_none_match,
+                                 lambda: find_user_in_db(user_id, instance=instance, options=loaders.USER_VERSION),
+                                 lambda: find_user_in_db(user_id, instance=instance, options=loaders.USER_DETAIL))
+
+@asynccontextmanager
+async def unique_email(instance: AsyncSession):
+    """Turn violation of unique index of emails into 409, e.g. when two
+    requests take the same email at once"""
+    try:
+        yield
+    except db.IntegrityError as exc:
+        if 'ix_users_email' not in str(exc.orig):
+            raise
+        await instance.rollback()
+        raise HTTPException(status_code=409, detail='Email already in use')
 
-@app.post('/users/add', response_model=User)
-def create_user(username: str, email: str, password: str, instance: Session = Depends(db.get_session)):
+@public.post('/users/add', response_model=User)
+async def create_user(username: str, email: str, password: str, instance: AsyncSession = Depends(db.get_async_session)):
     """Create new user db.UserT class by passing UserCreate variables"""
-    new_user = db.UserT(username, email, password)
+    new_user = db.UserT(username, email, await sc.get_password_hash(password))
     instance.add(new_user)
-    instance.commit()
-    return new_user
+    async with unique_email(instance):
+        await instance.commit()
+    return await find_user_in_db(new_user.user_id, instance=instance, options=loaders.USER_DETAIL)
 
 @auth.post('/users/update', response_model=User)
-def update_user(user_id: int, params: UserUpdate, instance: Session = Depends(db.get_session)):
+async def update_user(user_id: int, params: UserUpdate, instance: AsyncSession = Depends(db.get_async_session)):
     """Update user"""
-    user_to_update = find_user_in_db(user_id, instance=instance)
+    user_to_update = await find_user_in_db(user_id, instance=instance, options=loaders.USER_DETAIL)
     # Updating user information with model_dump() and setattr()
     update_data = params.model_dump(exclude_unset=True)
     [setattr(user_to_update, key, value) for key, value in update_data.items()]
-    instance.commit()
+    # Changed email is flushed by the first statement below
+    async with unique_email(instance):
+        # Tasks embed name and email of assigned users
+        await mark_changed(instance, task_ids=[task.task_id for task in user_to_update.assigned_tasks],
+                           user_ids=[user_id])
+        # Tokens carry name and email of the user
+        if update_data:
+            await sc.revoke_user_tokens(user_id, instance)
+        await commit_changes(instance)
     return user_to_update
 
-@auth.delete('/users/delete/{user_id}', response_model=UserDelete)
-def delete_user(user_id: int, instance: Session = Depends(db.get_session)):
-    """Delete user by entering his ID and tasks that he owns"""
-    user_to_del = find_user_in_db(user_id, instance=instance)
-    instance.delete(user_to_del)
-    instance.commit()
+async def detach_user(user_id: int, instance: AsyncSession):
+    """Remove user from tasks of other users: assignments and comments on
+    tasks the user doesn't own"""
+    assoc = db.user_task_association
+    assigned = await lock_tasks(db.TaskT.task_id.in_(db.select(assoc.c.task_id).where(assoc.c.user_id == user_id)),
+                                instance)
+    comments = db.CommentT.user_id == user_id, db.CommentT.task_id.not_in(
+        db.select(db.TaskT.task_id).where(db.TaskT.owner_id == user_id))
+    commented = set((await instance.execute(db.select(db.CommentT.task_id).where(*comments).distinct())).scalars())
+    await events.record(instance, 'assignees_changed', assigned, {'added': [], 'removed': [user_id]}, user_ids=[user_id])
+    await events.record(instance, 'comment_deleted', commented, {'user_id': user_id})
+    await instance.execute(db.delete(assoc).where(assoc.c.user_id == user_id))
+    await instance.execute(db.delete(db.CommentT).where(*comments).execution_options(synchronize_session=False))
+    await mark_changed(instance, task_ids=assigned | commented)
+
+async def delete_owned_tasks(user_id: int, instance: AsyncSession, limit: Optional[int] = None) -> int:
+    """Delete tasks owned by user, at most limit of them, and return how many
+    were deleted. Comments and assignments are deleted by ON DELETE CASCADE"""
+    query = db.select(db.TaskT.task_id).where(db.TaskT.owner_id == user_id).order_by(db.TaskT.task_id).limit(limit)
+    task_ids = list((await instance.execute(query)).scalars())
+    if not task_ids:
+        return 0
+    assoc = db.user_task_association
+    assignees = (await instance.execute(db.select(assoc.c.user_id).where(assoc.c.task_id.in_(task_ids)).distinct())).scalars()
+    await events.record(instance, 'task_deleted', task_ids)
+    await mark_changed(instance, task_ids=task_ids, user_ids=assignees)
+    await instance.execute(db.delete(db.TaskT).where(db.TaskT.task_id.in_(task_ids))
+                           .execution_options(synchronize_session=False))
+    return len(task_ids)
+
+@auth.delete('/users/delete/{user_id}', response_model=UserDelete,
+             responses={202: {'model': UserDelete, 'description': 'Deletion was scheduled'}})
+async def delete_user(user_id: int, instance: AsyncSession = Depends(db.get_async_session)):
+    """Delete user by entering his ID and tasks that he owns. User owning more
+    than USER_PURGE_THRESHOLD tasks is hidden at once and deleted in
+    background (202), progress is reported by GET /users/{user_id}/purge"""
+    user_to_del = await find_user_in_db(user_id, instance=instance, options=loaders.USER_SUMMARY)
+    owned_counts = counters.user_counts_query(user_id, role='owner').subquery()
+    owned = (await instance.execute(db.select(db.func.coalesce(db.func.sum(owned_counts.c.count), 0)))).scalar()
+    await detach_user(user_id, instance)
+    await sc.revoke_user_tokens(user_id, instance)
+    if owned > USER_PURGE_THRESHOLD:
+        await instance.execute(db.update(db.UserT).where(db.UserT.user_id == user_id)
+                               .values(deleted_at=db.func.now()).execution_options(synchronize_session=False))
+        await instance.execute(db.insert(db.user_purges).values(user_id=user_id, tasks_total=owned))
+        await mark_changed(instance, user_ids=[user_id])
+        await commit_changes(instance)
+        run_in_background(purge_user(user_id))
+        response = UserDelete(user_id=user_id, username=user_to_del.username, email=user_to_del.email,
+                              detail=f'The user was deleted. {owned} tasks created by the user are being deleted '
+                                     f'in background, see /users/{user_id}/purge')
+        return JSONResponse(response.model_dump(), status_code=202)
+    await delete_owned_tasks(user_id, instance)
+    await instance.execute(db.delete(db.UserT).where(db.UserT.user_id == user_id)
+                           .execution_options(synchronize_session=False))
+    await mark_changed(instance, user_ids=[user_id])
+    await commit_changes(instance)
     return user_to_del
 
+async def purge_user(user_id: int):
+    """Delete tasks of soft deleted user in batches, every batch in its own
+    transaction, then the user. Purge row is locked for the batch, so a purge
+    already running in other worker is left alone"""
+    purges = db.user_purges.c
+    deleted = True
+    try:
+        while deleted:
+            async with db.AsyncSessionLocal() as instance:
+                query = db.select(purges.user_id).where(purges.user_id == user_id, purges.finished_at.is_(None)) \
+                          .with_for_update(skip_locked=True)
+                if (await instance.execute(query)).first() is None:
+                    return
+                deleted = await delete_owned_tasks(user_id, instance, limit=USER_PURGE_BATCH)
+                values = {'tasks_deleted': purges.tasks_deleted + deleted, 'updated_at': db.func.now()}
+                if not deleted:
+                    await instance.execute(db.delete(db.UserT).where(db.UserT.user_id == user_id)
+                                           .execution_options(synchronize_session=False))
+                    await mark_changed(instance, user_ids=[user_id])
+                    values['finished_at'] = db.func.now()
+                await instance.execute(db.update(db.user_purges).where(purges.user_id == user_id).values(**values))
+                await commit_changes(instance)
+    except Exception:
+        # Purge is resumed on the next startup
+        log.exception('Purge of user %s failed', user_id)
+
+async def resume_purges():
+    """Continue purges interrupted by shutdown"""
+    purges = db.user_purges.c
+    async with db.AsyncSessionLocal() as instance:
+        user_ids = list((await instance.execute(db.select(purges.user_id).where(purges.finished_at.is_(None)))).scalars())
+    for user_id in user_ids:
+        await purge_user(user_id)
+
+@auth.get('/users/{user_id}/purge', response_model=UserPurge)
+async def get_user_purge(user_id: int, instance: AsyncSession = Depends(db.get_async_session)):
+    """Progress of background deletion of user. The row is kept after the
+    purge finished"""
+    purge = (await instance.execute(db.select(db.user_purges).where(db.user_purges.c.user_id == user_id))).mappings().first()
+    if purge is None:
+        raise HTTPException(status_code=404, detail='Purge not found')
+    return purge
+
+
+@auth.post('/users/add/bulk', response_model=BulkResult)
+async def create_users_bulk(items: Annotated[List[UserBulkCreate], Body(max_length=MAX_BULK_ITEMS)],
+                            instance: AsyncSession = Depends(db.get_async_session)):
+    """Create many users in one transaction. Items with email already in use are rejected"""
+    results = [BulkItemResult(index=i) for i in range(len(items))]
+    taken = await find_existing_in_db(db.UserT.email, {item.email for item in items}, instance)
+    valid = []
+    for i, item in enumerate(items):
+        if item.email in taken:
+            results[i].error = 'Email already in use'
+            continue
+        taken.add(item.email)
+        valid.append(i)
+    # Passwords are hashed in parallel by bcrypt worker pool
+    hashes = await asyncio.gather(*(sc.get_password_hash(items[i].password) for i in valid))
+    rows = [{'username': items[i].username, 'email': items[i].email, 'password': password_hash}
+            for i, password_hash in zip(valid, hashes)]
+    # Email taken by concurrent request after the check is rejected per item
+    # instead of failing the batch on unique index
+    ids = {}
+    if rows:
+        query = pg_insert(db.UserT).values(rows).on_conflict_do_nothing(index_elements=[db.UserT.email]) \
+                                   .returning(db.UserT.email, db.UserT.user_id)
+        ids = dict((await instance.execute(query)).tuples().all())
+    await instance.commit()
+    for i in valid:
+        if items[i].email not in ids:
+            results[i].error = 'Email already in use'
+    valid = [i for i in valid if items[i].email in ids]
+    return bulk_result(results, valid, [ids[items[i].email] for i in valid])
+
+@auth.get('/users/{user_id}/summary', response_model=UserTaskSummary)
+async def get_user_summary(user_id: int, instance: AsyncSession = Depends(db.get_async_session)):
+    """Return number of tasks owned by and assigned to user in every status.
+    Counts are read from counters maintained by database"""
+    await find_user_in_db(user_id, instance=instance)
+    rows = (await instance.execute(counters.user_counts_query(user_id))).all()
+    counts = {'owner': {}, 'assignee': {}}
+    for role, status, count in rows:
+        counts[role][status] = count
+    overdue_owned = db.select(db.func.count()).where(db.TaskT.owner_id == user_id, overdue_clause())
+    overdue_assigned = db.select(db.func.count()).select_from(db.TaskT).join(db.user_task_association).where(
+        db.user_task_association.c.user_id == user_id, overdue_clause())
+    return {'user_id': user_id, 'owned': counts['owner'], 'assigned': counts['assignee'],
+            'overdue_owned': (await instance.execute(overdue_owned)).scalar(),
+            'overdue_assigned': (await instance.execute(overdue_assigned)).scalar()}
+
+@auth.get('/cache/stats')
+async def get_cache_stats():
+    """Return hit/miss counters, hit ratio and evictions of caches"""
+    return {'response': await response_cache.stats()}
+
 
 # API task endpoints
 
-@auth.get('/tasks', response_model=List[Task])
-def get_tasks(instance: Session = Depends(db.get_session)):
-    """Return all tasks"""
-    tasks = instance.execute(db.select(db.TaskT)).unique().scalars()
-    result = [task for task in tasks]
-    return result
+@auth.get('/tasks', response_model=Union[TaskPage, TaskBriefPage])
+async def get_tasks(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                    cursor: Optional[str] = None,
+                    order: SortOrder = 'asc',
+                    owner_id: Optional[int] = None,
+                    assigned_user_id: Optional[int] = None,
+                    start_date_from: Optional[datetime.date] = None,
+                    start_date_to: Optional[datetime.date] = None,
+                    end_date_from: Optional[datetime.date] = None,
+                    end_date_to: Optional[datetime.date] = None,
+                    view: TaskView = 'full',
+                    if_none_match: Optional[str] = Header(None),
+                    instance: AsyncSession = Depends(db.get_read_session)):
+    """Return one page of tasks ordered by task ID. Every filter is optional,
+    date ranges are inclusive. Pass next_cursor from previous response to get the next page.
+    view=summary returns number of comments and assignees instead of their lists"""
+    query = db.select(db.TaskT).options(*loaders.TASK_VERSION)
+    if owner_id is not None:
+        query = query.where(db.TaskT.owner_id == owner_id)
+    if assigned_user_id is not None:
+        query = query.where(db.exists().where(db.user_task_association.c.task_id == db.TaskT.task_id,
+                                              db.user_task_association.c.user_id == assigned_user_id))
+    if start_date_from is not None:
+        query = query.where(db.TaskT.start_date >= start_date_from)
+    if start_date_to is not None:
+        query = query.where(db.TaskT.start_date <= start_date_to)
+    if end_date_from is not None:
+        query = query.where(db.TaskT.end_date >= end_date_from)
+    if end_date_to is not None:
+        query = query.where(db.TaskT.end_date <= end_date_to)
+    if view == 'summary':
+        return await versioned_page(instance, query, db.TaskT.task_id, lambda ids: find_task_briefs_in_db(ids, instance),
+                                    TASK_BRIEF_PAGE, limit, cursor, order, if_none_match, kind='tasks.summary')
+    return await versioned_page(instance, query, db.TaskT.task_id, lambda ids: find_task_rows_in_db(ids, instance),
+                                TASK_PAGE, limit, cursor, order, if_none_match)
 
-@auth.get('/tasks/{task_id}', response_model=Task)
-def get_task(task_id: int, instance: Session = Depends(db.get_session)):
-    """Return one task by entering task ID"""
-    task = find_task_in_db(task_id, instance=instance)
-    return task
+@auth.get('/tasks/summary', response_model=TaskSummary)
+async def get_tasks_summary(instance: AsyncSession = Depends(db.get_async_session)):
+    """Return number of tasks in every status and number of overdue tasks.
+    Counts are read from counters maintained by database, overdue tasks are
+    counted with partial index of not finished tasks"""
+    counts = dict((await instance.execute(counters.status_totals_query())).tuples().all())
+    overdue = (await instance.execute(db.select(db.func.count()).where(overdue_clause()))).scalar()
+    return {'counts': counts, 'overdue': overdue}
+
+@auth.get('/tasks/search', response_model=TaskSearchPage)
+async def search_tasks(q: str = Query(..., min_length=1, max_length=512),
+                       match: search.SearchMatch = 'auto',
+                       limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                       cursor: Optional[str] = None,
+                       instance: AsyncSession = Depends(db.get_async_session)):
+    """Search tasks by title, description and comments, best matches first.
+    'fulltext' matches words (web search syntax, e.g. "exact phrase" -excluded),
+    'fuzzy' matches similar titles and title prefixes, 'auto' falls back to
+    fuzzy when full-text search finds nothing"""
+    task_ids, used_match, next_cursor = await search.search_task_ids(instance, q, match, limit, cursor)
+    tasks = await find_task_rows_in_db(task_ids, instance)
+    return json_response(TASK_SEARCH_PAGE, {'items': tasks, 'next_cursor': next_cursor, 'match': used_match})
+
+@auth.get('/tasks/export')
+async def export_tasks(format: export.ExportFormat = 'ndjson',
+                       updated_since: Optional[datetime.datetime] = None):
+    """Stream all tasks with comments and assigned users as NDJSON or CSV.
+    Pass X-Export-Watermark header of previous export as updated_since to get
+    only tasks changed since then, followed by tombstones of deleted tasks
+    (task_id and deleted_at). Tombstones are kept for EVENTS_RETENTION_HOURS,
+    older updated_since is rejected with 410 and full export is needed"""
+    watermark = await export.export_watermark()
+    if updated_since is not None:
+        if updated_since.tzinfo is None:
+            updated_since = updated_since.replace(tzinfo=datetime.timezone.utc)
+        if updated_since < watermark - export.TOMBSTONE_RETENTION:
+            raise HTTPException(status_code=410, detail='Deleted tasks are no longer known, export all tasks')
+    return StreamingResponse(export.stream_tasks(format, updated_since),
+                             media_type=export.MEDIA_TYPES[format],
+                             headers={'X-Export-Watermark': watermark.isoformat()})
+
+@auth.get('/tasks/{task_id}', response_model=Union[Task, TaskBrief])
+async def get_task(task_id: int, view: TaskView = 'full', if_none_match: Optional[str] = Header(None),
+                   instance: AsyncSession = Depends(db.get_read_session)):
+    """Return one task by entering task ID. Response is served from cache, 304
+    is returned when If-None-Match matches ETag. view=summary returns number of
+    comments and assignees instead of their lists, read with one query"""
+    if view == 'summary':
+        tasks = await find_task_briefs_in_db([task_id], instance)
+        if not tasks:
+            raise HTTPException(status_code=404, detail='Task not found')
+        etag = make_etag(f'{task_key(task_id)}.summary', tasks[0]['version'])
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        return json_response(TASK_BRIEF, tasks[0], headers={'ETag': etag})
+    return await cached_response(task_key(task_id), Task, if_none_match,
+                                 lambda: find_task_in_db(task_id, instance=instance, options=loaders.TASK_VERSION),
+                                 lambda: find_task_in_db(task_id, instance=instance, options=loaders.TASK_DETAIL))
+
+@auth.get('/tasks/{task_id}/comments', response_model=CommentPage)
+async def get_task_comments(task_id: int,
+                            limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                            cursor: Optional[str] = None,
+                            order: SortOrder = 'asc',
+                            instance: AsyncSession = Depends(db.get_read_session)):
+    """Return one page of task comments ordered by time they were added or last
+    edited. Pass next_cursor from previous response to get the next page"""
+    query = db.select(db.CommentT).where(db.CommentT.task_id == task_id).options(*loaders.COMMENT_DETAIL)
+    comments, next_cursor = await paginate_keyset(instance, query, (db.CommentT.timestamp, db.CommentT.comment_id),
+                                                  limit, cursor, order)
+    # Existence of the task is checked only when there is nothing to return
+    if not comments and cursor is None:
+        await find_task_in_db(task_id, instance=instance)
+    return {'items': comments, 'next_cursor': next_cursor}
 
 @auth.post('/tasks/add', response_model=Task)
-def add_task(user_id: int, title: str, description: str, instance: Session = Depends(db.get_session)):
+async def add_task(user_id: int, title: str, description: str, instance: AsyncSession = Depends(db.get_async_session)):
     """Add new task"""
-    find_user_in_db(user_id, instance=instance)
+    await find_user_in_db(user_id, instance=instance)
     new_task = db.TaskT(user_id, title, description)
     instance.add(new_task)
-    instance.commit()
-    return new_task
+    await instance.flush()
+    await events.record(instance, 'task_added', [new_task.task_id])
+    await mark_changed(instance, user_ids=[user_id])
+    await commit_changes(instance)
+    return await find_task_in_db(new_task.task_id, instance=instance, options=loaders.TASK_DETAIL)
 
 @auth.post('/tasks/assign', response_model=Task)
-def assign_user_to_task(owner_id: int, task_id: int, user_id_to_assign: int, instance: Session = Depends(db.get_session)):
-    """Assign user to task"""
-    find_user_in_db(owner_id, instance=instance)
-    user_to_assign = find_user_in_db(user_id_to_assign, instance=instance)
-    task = find_task_in_db(task_id, instance=instance)
-    task.assigned_users.append(user_to_assign)
-    instance.commit()
-    return task
+async def assign_user_to_task(owner_id: int, task_id: int, user_id_to_assign: int, instance: AsyncSession = Depends(db.get_async_session)):
+    """Assign user to task. Only owner of the task can assign users. Assigning
+    already assigned user changes nothing"""
+    await change_task_assignees(owner_id, task_id, assignments.add_assignees, {user_id_to_assign}, instance)
+    return await find_task_in_db(task_id, instance=instance, options=loaders.TASK_DETAIL)
+
+async def change_task_assignees(owner_id: int, task_id: int, change, user_ids: set, instance: AsyncSession) -> dict:
+    """Apply one of assignments.*_assignees functions and commit. Unknown users
+    reject the whole request"""
+    await authz.require_task_owner(owner_id, task_id, instance, action='assign users to')
+    await lock_tasks(db.TaskT.task_id == task_id, instance)
+    result = await change(task_id, set(user_ids), instance)
+    if result.missing:
+        raise HTTPException(status_code=404, detail=f'User not found: {", ".join(map(str, sorted(result.missing)))}')
+    if result.added or result.removed:
+        await events.record(instance, 'assignees_changed', [task_id],
+                            {'added': sorted(result.added), 'removed': sorted(result.removed)}, user_ids=result.removed)
+        await mark_changed(instance, task_ids=[task_id], user_ids=result.added | result.removed)
+    await commit_changes(instance)
+    return {'task_id': task_id, 'added': sorted(result.added), 'removed': sorted(result.removed)}
+
+@auth.post('/tasks/assignees/add', response_model=TaskAssigneesChange)
+async def add_task_assignees(owner_id: int, task_id: int,
+                             user_ids: Annotated[List[int], Body(embed=True, max_length=MAX_BULK_ITEMS)],
+                             instance: AsyncSession = Depends(db.get_async_session)):
+    """Assign users to task, already assigned users are skipped"""
+    return await change_task_assignees(owner_id, task_id, assignments.add_assignees, user_ids, instance)
+
+@auth.post('/tasks/assignees/remove', response_model=TaskAssigneesChange)
+async def remove_task_assignees(owner_id: int, task_id: int,
+                                user_ids: Annotated[List[int], Body(embed=True, max_length=MAX_BULK_ITEMS)],
+                                instance: AsyncSession = Depends(db.get_async_session)):
+    """Unassign users from task, users which aren't assigned are skipped"""
+    return await change_task_assignees(owner_id, task_id, assignments.remove_assignees, user_ids, instance)
+
+@auth.post('/tasks/assignees/replace', response_model=TaskAssigneesChange)
+async def replace_task_assignees(owner_id: int, task_id: int,
+                                 user_ids: Annotated[List[int], Body(embed=True, max_length=MAX_BULK_ITEMS)],
+                                 instance: AsyncSession = Depends(db.get_async_session)):
+    """Set users assigned to task to exactly user_ids, empty list unassigns everyone"""
+    return await change_task_assignees(owner_id, task_id, assignments.replace_assignees, user_ids, instance)
+
+@auth.post('/tasks/add/bulk', response_model=BulkResult)
+async def add_tasks_bulk(items: Annotated[List[TaskBulkCreate], Body(max_length=MAX_BULK_ITEMS)],
+                         instance: AsyncSession = Depends(db.get_async_session)):
+    """Add many tasks in one transaction. Items with not existing user are rejected"""
+    results = [BulkItemResult(index=i) for i in range(len(items))]
+    users = await find_existing_in_db(db.UserT.user_id, {item.user_id for item in items}, instance,
+                                      db.UserT.deleted_at.is_(None))
+    valid = []
+    for i, item in enumerate(items):
+        if item.user_id not in users:
+            results[i].error = 'User not found'
+            continue
+        valid.append(i)
+    rows = [{'owner_id': items[i].user_id, 'title': items[i].title, 'description': items[i].description}
+            for i in valid]
+    ids = await insert_many(db.TaskT, db.TaskT.task_id, rows, instance)
+    await events.record(instance, 'task_added', ids)
+    await mark_changed(instance, user_ids=[items[i].user_id for i in valid])
+    await commit_changes(instance)
+    return bulk_result(results, valid, ids)
+
+@auth.post('/tasks/assign/bulk', response_model=BulkResult)
+async def assign_users_to_tasks_bulk(items: Annotated[List[TaskBulkAssign], Body(max_length=MAX_BULK_ITEMS)],
+                                     instance: AsyncSession = Depends(db.get_async_session)):
+    """Assign many users to tasks in one transaction. Items with not existing
+    user or task and already assigned users are rejected"""
+    results = [BulkItemResult(index=i) for i in range(len(items))]
+    users = await find_existing_in_db(db.UserT.user_id, {item.user_id for item in items}, instance,
+                                      db.UserT.deleted_at.is_(None))
+    tasks = await lock_tasks(db.TaskT.task_id.in_({item.task_id for item in items}), instance)
+    assigned = await find_assignments_in_db({(item.task_id, item.user_id) for item in items
+                                             if item.task_id in tasks and item.user_id in users}, instance)
+    valid = []
+    for i, item in enumerate(items):
+        if item.user_id not in users:
+            results[i].error = 'User not found'
+        elif item.task_id not in tasks:
+            results[i].error = 'Task not found'
+        elif (item.task_id, item.user_id) in assigned:
+            results[i].error = 'User is already assigned to this task'
+        else:
+            assigned.add((item.task_id, item.user_id))
+            valid.append(i)
+    if valid:
+        rows = [{'task_id': items[i].task_id, 'user_id': items[i].user_id} for i in valid]
+        await instance.execute(db.insert(db.user_task_association), rows)
+    await events.record(instance, 'assignees_changed', [items[i].task_id for i in valid])
+    await mark_changed(instance, task_ids=[items[i].task_id for i in valid], user_ids=[items[i].user_id for i in valid])
+    await commit_changes(instance)
+    return BulkResult(created=len(valid), results=results)
 
 @auth.post('/tasks/update', response_model=Task)
-def update_task(owner_id: int, task_id: int, params: TaskUpdate, instance: Session = Depends(db.get_session)):
+async def update_task(owner_id: int, task_id: int, params: TaskUpdate, instance: AsyncSession = Depends(db.get_async_session)):
     """Update task"""
-    find_user_in_db(owner_id, instance=instance)
-    task_to_update = find_task_in_db(task_id, instance=instance)
-    is_user_owner = True if owner_id == task_to_update.owner_id else False
-    if is_user_owner is False:
-        raise HTTPException(status_code=403, detail='Permission denied. This user does not have permission to update this task.')
-    else:
-        # Updating user information with model_dump() and setattr()
-        update_data = params.model_dump(exclude_unset=True)
-        [setattr(task_to_update, key, value) for key, value in update_data.items()]
-        instance.commit()
+    await authz.require_task_owner(owner_id, task_id, instance, action='update')
+    # Status transition is checked against the current status
+    await lock_tasks(db.TaskT.task_id == task_id, instance)
+    task_to_update = await find_task_in_db(task_id, instance=instance, options=loaders.TASK_DETAIL)
+    # Updating user information with model_dump() and setattr()
+    update_data = params.model_dump(exclude_unset=True)
+    status = update_data.get('status', task_to_update.status)
+    if status != task_to_update.status and status not in db.TASK_STATUS_TRANSITIONS[task_to_update.status]:
+        raise HTTPException(status_code=409, detail=f'Task status cannot be changed from {task_to_update.status} to {status}')
+    [setattr(task_to_update, key, value) for key, value in update_data.items()]
+    await events.record(instance, 'task_updated', [task_id], {'fields': sorted(update_data)})
+    await mark_changed(instance, task_ids=[task_id])
+    await commit_changes(instance)
     return task_to_update
 
 @auth.delete('/tasks/delete/{task_id}', response_model=TaskDelete)
-def delete_task(task_id: int, instance: Session = Depends(db.get_session)):
+async def delete_task(task_id: int, instance: AsyncSession = Depends(db.get_async_session)):
     """Delete task"""
-    task_to_del = find_task_in_db(task_id, instance=instance)
-    instance.delete(task_to_del)
-    instance.commit()
+    task_to_del = await find_task_in_db(task_id, instance=instance, options=loaders.TASK_DETAIL)
+    await events.record(instance, 'task_deleted', [task_id])
+    await mark_changed(instance, task_ids=[task_id],
+                       user_ids=[task_to_del.owner_id] + [user.user_id for user in task_to_del.assigned_users])
+    # Comments and assignments are deleted by database (ON DELETE CASCADE)
+    await instance.execute(db.delete(db.TaskT).where(db.TaskT.task_id == task_id)
+                           .execution_options(synchronize_session=False))
+    await commit_changes(instance)
     return task_to_del
 
 
 # API comment endopoint
 
 @auth.post('/tasks/comments/add', response_model=Comment)
-def add_comment(user_id: int, task_id: int, comment: str, instance: Session = Depends(db.get_session)):
+async def add_comment(user_id: int, task_id: int, comment: str, instance: AsyncSession = Depends(db.get_async_session)):
     """Add new comment in specific task"""
-    user = find_user_in_db(user_id, instance=instance)
-    task = find_task_in_db(task_id, instance=instance)
     # Checking if user owns or is assigned to task
-    is_assigned = [t.task_id for t in user.assigned_tasks if t.task_id == task.task_id]
-    is_owned = [t.task_id for t in user.owned_tasks if t.task_id == task.task_id]
-    if not (is_owned or is_assigned):
-        raise HTTPException(status_code=403, detail='Permission denied. This user does not have permission to comment this task.')
-    # Creating new comment, appending it to relationships list in task.comments finally commit
+    await authz.require_task_member(user_id, task_id, instance, action='comment')
+    # Creating new comment and adding it directly, so task.comments is not loaded
     new_comment = db.CommentT(user_id, task_id, comment)
-    task.comments.append(new_comment)
-    instance.add(task)
-    instance.commit()
-    return new_comment
+    instance.add(new_comment)
+    await instance.flush()
+    await events.record(instance, 'comment_added', [task_id], {'comment_id': new_comment.comment_id})
+    await mark_changed(instance, task_ids=[task_id])
+    await commit_changes(instance)
+    return await find_comment_in_db(new_comment.comment_id, instance=instance)
+
+@auth.post('/tasks/comments/add/bulk', response_model=BulkResult)
+async def add_comments_bulk(items: Annotated[List[CommentBulkCreate], Body(max_length=MAX_BULK_ITEMS)],
+                            instance: AsyncSession = Depends(db.get_async_session)):
+    """Add many comments in one transaction. Like in add_comment user must own
+    or be assigned to the task, otherwise item is rejected"""
+    results = [BulkItemResult(index=i) for i in range(len(items))]
+    access = await authz.task_access_many({(item.task_id, item.user_id) for item in items}, instance)
+    valid = []
+    for i, item in enumerate(items):
+        if (item.task_id, item.user_id) not in access:
+            results[i].error = 'Task not found'
+        elif not access[(item.task_id, item.user_id)].is_member:
+            results[i].error = 'Permission denied. This user does not have permission to comment this task.'
+        else:
+            valid.append(i)
+    rows = [{'user_id': items[i].user_id, 'task_id': items[i].task_id, 'comment': items[i].comment}
+            for i in valid]
+    ids = await insert_many(db.CommentT, db.CommentT.comment_id, rows, instance)
+    await events.record(instance, 'comment_added', [items[i].task_id for i in valid])
+    await mark_changed(instance, task_ids=[items[i].task_id for i in valid])
+    await commit_changes(instance)
+    return bulk_result(results, valid, ids)
 
 @auth.post('/tasks/comments/update', response_model=Comment)
-def update_comment(user_id: int, comment_id: int, params: CommentUpdate, instance: Session = Depends(db.get_session)):
-    """Update comment"""
-    find_user_in_db(user_id, instance=instance)
-    comment_to_update = find_comment_in_db(comment_id, instance=instance)
-    if not user_id == comment_to_update.user_id:
-        raise HTTPException(status_code=403, detail='Permission denied. This user does not have permission to update this comment.')
+async def update_comment(user_id: int, comment_id: int, params: CommentUpdate, instance: AsyncSession = Depends(db.get_async_session)):
+    """Update comment. Only author of the comment can update it"""
+    comment_to_update = await find_comment_in_db(comment_id, instance=instance)
+    await authz.require_comment_author(user_id, comment_to_update, instance, action='update')
     update_data = params.model_dump(exclude_unset=True)
     [setattr(comment_to_update, key, value) for key, value in update_data.items()]
-    instance.commit()
-    return comment_to_update
+    await events.record(instance, 'comment_updated', [comment_to_update.task_id], {'comment_id': comment_id})
+    await mark_changed(instance, task_ids=[comment_to_update.task_id])
+    await commit_changes(instance)
+    # Timestamp is refreshed by database on update so comment is reloaded
+    return await find_comment_in_db(comment_id, instance=instance)
 
 @auth.delete('/tasks/comments/delete', response_model=CommentDelete)
-def delete_comment(user_id: int, comment_id: int, instance: Session = Depends(db.get_session)):
-    """Delete comment"""
-    # Check if user exist
-    user = find_user_in_db(user_id, instance=instance)
-    comment_to_del = find_comment_in_db(comment_id, instance=instance)
-    instance.delete(comment_to_del)
-    instance.commit()
+async def delete_comment(user_id: int, comment_id: int, instance: AsyncSession = Depends(db.get_async_session)):
+    """Delete comment. Only author of the comment or owner of the task can delete it"""
+    comment_to_del = await find_comment_in_db(comment_id, instance=instance)
+    await authz.require_comment_author(user_id, comment_to_del, instance, action='delete', task_owner_allowed=True)
+    await events.record(instance, 'comment_deleted', [comment_to_del.task_id], {'comment_id': comment_id})
+    await instance.delete(comment_to_del)
+    await mark_changed(instance, task_ids=[comment_to_del.task_id])
+    await commit_changes(instance)
     return comment_to_del
 
 
 
-app.include_router(auth)
\ No newline at end of file
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Connect to database on startup, release connections and bcrypt
+    workers on shutdown"""
+    db.configure_engines()
+    run_in_background(resume_purges())
+    run_in_background(revocations.keep_fresh())
+    run_in_background(counters.keep_compacted())
+    yield
+    for task in list(_background_tasks):
+        task.cancel()
+    await events.broker.stop()
+    await db.dispose_engines()
+    shutdown_pool()
+
+def create_app() -> FastAPI:
+    """Application factory. Creating app has no side effects, database
+    engines are configured in lifespan"""
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.include_router(public)
+    app.include_router(auth)
+    return app
+
+app = create_app()
\ No newline at end of file
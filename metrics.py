@@ -0,0 +1,200 @@
+from contextvars import ContextVar
+from dataclasses import dataclass
+from sqlalchemy import event
+from typing import Optional
+import bisect
+import logging
+import threading
+import time
+import os
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+# Requests slower than this (milliseconds) are logged together with SQL
+# statements they issued. Disabled (0) by default
+METRICS_SLOW_REQUEST_MS = float(os.getenv('METRICS_SLOW_REQUEST_MS', 0))
+
+slow_log = logging.getLogger('tms.slow_requests')
+
+# Metrics are kept in process and exposed in Prometheus text format by
+# /metrics. With several workers every worker reports its own values
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter():
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Histogram():
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> (count per bucket with +Inf last, sum)
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            counts, total = self._values.get(label_values, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[label_values] = (counts, total + value)
+
+    def count(self, *label_values) -> int:
+        return sum(self._values.get(label_values, ([], 0))[0])
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float('inf') else f'le="{float(bound)!r}"'
+                    lines.append(f'{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}')
+                lines.append(f'{self.name}_sum{_format_labels(self.labels, label_values)} {total}')
+                lines.append(f'{self.name}_count{_format_labels(self.labels, label_values)} {cumulative}')
+        return lines
+
+
+REGISTRY: list = []
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+def render() -> str:
+    return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
+
+
+http_requests = register(Counter('http_requests_total', 'Handled HTTP requests', ('method', 'route', 'status')))
+http_duration = register(Histogram('http_request_duration_seconds', 'Time spent handling HTTP request',
+                                   ('method', 'route')))
+http_db_duration = register(Histogram('http_request_db_seconds', 'Time spent executing SQL statements per request',
+                                      ('method', 'route')))
+http_db_queries = register(Histogram('http_request_db_queries', 'SQL statements executed per request',
+                                     ('method', 'route'), buckets=COUNT_BUCKETS))
+db_pool_wait = register(Histogram('db_pool_wait_seconds', 'Time spent waiting for connection from pool'))
+db_replica_errors = register(Counter('db_replica_errors_total', 'Failed connections to read replica, '
+                                     'reads went to next replica or primary', ('replica',)))
+bcrypt_duration = register(Histogram('bcrypt_seconds', 'Time of bcrypt jobs including wait for free worker',
+                                     ('operation',)))
+rate_limit_rejected = register(Counter('rate_limit_rejected_total', 'Requests rejected by rate limiter',
+                                       ('limiter',)))
+
+
+@dataclass
+class RequestStats():
+    """SQL statistics of one request, collected by engine event hooks"""
+    queries: int = 0
+    db_seconds: float = 0.0
+    # (statement, seconds), collected only when slow request log is enabled
+    statements: Optional[list] = None
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar('current_request', default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    stats = current_request.get()
+    if stats is None:
+        return
+    stats.queries += 1
+    stats.db_seconds += elapsed
+    if stats.statements is not None:
+        stats.statements.append((statement, elapsed))
+
+def instrument_engine(engine):
+    """Attribute statements executed by engine to current request. Accepts
+    sync engine or sync_engine of async engine"""
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+def timed_pool(pool_class):
+    """Subclass of pool_class which measures how long checkout waits for
+    free connection (including opening new one)"""
+    class TimedPool(pool_class):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                db_pool_wait.observe(time.perf_counter() - start)
+    TimedPool.__name__ = f'Timed{pool_class.__name__}'
+    return TimedPool
+
+
+class MetricsMiddleware():
+    """ASGI middleware measuring every HTTP request. Requests are labelled by
+    route template (e.g. /tasks/{task_id}), not by URL"""
+    def __init__(self, app, slow_request_ms: float = METRICS_SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats(statements=[] if self.slow_request_ms else None)
+        token = current_request.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request.reset(token)
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            method = scope['method']
+            http_requests.inc(method, route, str(status))
+            http_duration.observe(elapsed, method, route)
+            http_db_duration.observe(stats.db_seconds, method, route)
+            http_db_queries.observe(stats.queries, method, route)
+            if self.slow_request_ms and elapsed * 1000 >= self.slow_request_ms:
+                slow_log.warning('%s %s took %.1f ms (status %s, %d statements, %.1f ms in database)%s',
+                                 method, scope['path'], elapsed * 1000, status, stats.queries,
+                                 stats.db_seconds * 1000,
+                                 ''.join(f'\n  [{seconds * 1000:.1f} ms] {statement}'
+                                         for statement, seconds in stats.statements))
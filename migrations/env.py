@@ -0,0 +1,31 @@
+from logging.config import fileConfig
+from alembic import context
+from sqlalchemy import create_engine, pool
+import db
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = db.Base.metadata
+
+
+def run_migrations_offline():
+    """Generate SQL script without connecting to database (alembic upgrade --sql)"""
+    context.configure(url=db.DATABASE_URL, target_metadata=target_metadata,
+                      literal_binds=True, dialect_opts={'paramstyle': 'named'})
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    connectable = create_engine(db.DATABASE_URL, poolclass=pool.NullPool)
+    with connectable.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
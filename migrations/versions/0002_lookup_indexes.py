@@ -0,0 +1,41 @@
+"""Lookup indexes, unique email and tasks.updated_at
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, Sequence[str], None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # NOTE: Fails if there already are users sharing one email, such
+    # duplicates have to be resolved by hand before upgrading
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+    op.create_index('ix_tasks_owner_id', 'tasks', ['owner_id'])
+    op.create_index('ix_comments_task_id', 'comments', ['task_id'])
+    op.create_index('ix_comments_user_id', 'comments', ['user_id'])
+    op.create_index('ix_user_task_association_task_id', 'user_task_association', ['task_id'])
+    op.add_column('tasks', sa.Column('updated_at', sa.DateTime(timezone=True),
+                                     server_default=sa.text('now()'), nullable=False))
+    op.create_index('ix_tasks_updated_at', 'tasks', ['updated_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_updated_at', table_name='tasks')
+    op.drop_column('tasks', 'updated_at')
+    op.drop_index('ix_user_task_association_task_id', table_name='user_task_association')
+    op.drop_index('ix_comments_user_id', table_name='comments')
+    op.drop_index('ix_comments_task_id', table_name='comments')
+    op.drop_index('ix_tasks_owner_id', table_name='tasks')
+    op.drop_index('ix_users_email', table_name='users')
@@ -0,0 +1,42 @@
+"""Full-text search vectors of tasks and comments, trigram index of titles
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, Sequence[str], None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # NOTE: Creating extension requires CREATE privilege on the database
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # Stored generated columns are computed for existing rows, which rewrites
+    # both tables
+    op.add_column('tasks', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(
+        "to_tsvector('english', title || ' ' || coalesce(description, ''))", persisted=True)))
+    op.add_column('comments', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(
+        "to_tsvector('english', comment)", persisted=True)))
+    op.create_index('ix_tasks_search_vector', 'tasks', ['search_vector'], postgresql_using='gin')
+    op.create_index('ix_comments_search_vector', 'comments', ['search_vector'], postgresql_using='gin')
+    op.create_index('ix_tasks_title_trgm', 'tasks', ['title'], postgresql_using='gin',
+                    postgresql_ops={'title': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_title_trgm', table_name='tasks')
+    op.drop_index('ix_comments_search_vector', table_name='comments')
+    op.drop_index('ix_tasks_search_vector', table_name='tasks')
+    op.drop_column('comments', 'search_vector')
+    op.drop_column('tasks', 'search_vector')
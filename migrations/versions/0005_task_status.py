@@ -0,0 +1,141 @@
+"""Task status and task counters maintained by triggers
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, Sequence[str], None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+STATUSES = ('open', 'in_progress', 'done', 'cancelled')
+
+# Counters are changed by row triggers, so every write path (ORM, bulk
+# inserts, foreign key cascades) keeps them in sync.
+# Deleted task is uncounted BEFORE delete, while its assignments still exist.
+# Assignment trigger locks the task row (FOR SHARE), so concurrent status
+# change and assignment of the same task cannot both count old status
+TRIGGERS = """
+CREATE FUNCTION user_task_counts_add(p_user_id integer, p_role text, p_status text, p_delta integer)
+RETURNS void AS $$
+BEGIN
+    IF p_delta > 0 THEN
+        INSERT INTO user_task_counts (user_id, role, status, count) VALUES (p_user_id, p_role, p_status, p_delta)
+        ON CONFLICT (user_id, role, status) DO UPDATE SET count = user_task_counts.count + EXCLUDED.count;
+    ELSE
+        -- Row always exists when decrementing, UPDATE also avoids inserting
+        -- counters of user which is being deleted
+        UPDATE user_task_counts SET count = count + p_delta
+        WHERE user_id = p_user_id AND role = p_role AND status = p_status;
+    END IF;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION tasks_count() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE task_status_totals SET count = count - 1 WHERE status = OLD.status;
+        PERFORM user_task_counts_add(OLD.owner_id, 'owner', OLD.status, -1);
+        PERFORM user_task_counts_add(a.user_id, 'assignee', OLD.status, -1)
+        FROM user_task_association a WHERE a.task_id = OLD.task_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE task_status_totals SET count = count + 1 WHERE status = NEW.status;
+        PERFORM user_task_counts_add(NEW.owner_id, 'owner', NEW.status, 1);
+        PERFORM user_task_counts_add(a.user_id, 'assignee', NEW.status, 1)
+        FROM user_task_association a WHERE a.task_id = NEW.task_id;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tasks_count_insert AFTER INSERT ON tasks
+FOR EACH ROW EXECUTE FUNCTION tasks_count();
+CREATE TRIGGER tasks_count_update AFTER UPDATE OF status, owner_id ON tasks
+FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status OR OLD.owner_id IS DISTINCT FROM NEW.owner_id)
+EXECUTE FUNCTION tasks_count();
+CREATE TRIGGER tasks_count_delete BEFORE DELETE ON tasks
+FOR EACH ROW EXECUTE FUNCTION tasks_count();
+
+CREATE FUNCTION user_task_association_count() RETURNS trigger AS $$
+DECLARE
+    task_status text;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT status INTO task_status FROM tasks WHERE task_id = NEW.task_id FOR SHARE;
+        PERFORM user_task_counts_add(NEW.user_id, 'assignee', task_status, 1);
+    ELSE
+        -- Assignments removed by cascade of deleted task were already
+        -- uncounted by tasks_count_delete
+        SELECT status INTO task_status FROM tasks WHERE task_id = OLD.task_id FOR SHARE;
+        IF FOUND THEN
+            PERFORM user_task_counts_add(OLD.user_id, 'assignee', task_status, -1);
+        END IF;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER user_task_association_count AFTER INSERT OR DELETE ON user_task_association
+FOR EACH ROW EXECUTE FUNCTION user_task_association_count();
+"""
+
+
+def upgrade() -> None:
+    op.add_column('tasks', sa.Column('status', sa.String(length=16), server_default='open', nullable=False))
+    op.create_check_constraint('ck_tasks_status', 'tasks', f'status IN {STATUSES}')
+    op.create_index('ix_tasks_active_end_date', 'tasks', ['end_date'],
+                    postgresql_where=sa.text("status IN ('open', 'in_progress') AND end_date IS NOT NULL"))
+    op.create_table('task_status_totals',
+                    sa.Column('status', sa.String(length=16), nullable=False),
+                    sa.Column('count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+                    sa.PrimaryKeyConstraint('status'))
+    op.create_table('user_task_counts',
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('role', sa.String(length=16), nullable=False),
+                    sa.Column('status', sa.String(length=16), nullable=False),
+                    sa.Column('count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+                    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('user_id', 'role', 'status'))
+    # Writes are blocked until counters are filled and triggers are in place
+    op.execute('LOCK TABLE tasks, user_task_association IN SHARE MODE')
+    op.execute(TRIGGERS)
+    op.execute(f"""
+        INSERT INTO task_status_totals (status, count)
+        SELECT s.status, (SELECT count(*) FROM tasks WHERE tasks.status = s.status)
+        FROM unnest(ARRAY{list(STATUSES)}) AS s(status)""")
+    op.execute("""
+        INSERT INTO user_task_counts (user_id, role, status, count)
+        SELECT owner_id, 'owner', status, count(*) FROM tasks GROUP BY owner_id, status""")
+    op.execute("""
+        INSERT INTO user_task_counts (user_id, role, status, count)
+        SELECT a.user_id, 'assignee', t.status, count(*)
+        FROM user_task_association a JOIN tasks t ON t.task_id = a.task_id
+        GROUP BY a.user_id, t.status""")
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER user_task_association_count ON user_task_association')
+    op.execute('DROP TRIGGER tasks_count_delete ON tasks')
+    op.execute('DROP TRIGGER tasks_count_update ON tasks')
+    op.execute('DROP TRIGGER tasks_count_insert ON tasks')
+    op.execute('DROP FUNCTION user_task_association_count()')
+    op.execute('DROP FUNCTION tasks_count()')
+    op.execute('DROP FUNCTION user_task_counts_add(integer, text, text, integer)')
+    op.drop_table('user_task_counts')
+    op.drop_table('task_status_totals')
+    op.drop_index('ix_tasks_active_end_date', table_name='tasks')
+    op.drop_constraint('ck_tasks_status', 'tasks', type_='check')
+    op.drop_column('tasks', 'status')
@@ -0,0 +1,53 @@
+"""Change feed of tasks announced with LISTEN/NOTIFY
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, Sequence[str], None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Notifications are delivered on commit, so listeners never see events of
+# rolled back transactions. Payload is only event ID, listener reads the row
+TRIGGER = """
+CREATE FUNCTION task_events_notify() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('task_events', NEW.event_id::text);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER task_events_notify AFTER INSERT ON task_events
+FOR EACH ROW EXECUTE FUNCTION task_events_notify();
+"""
+
+
+def upgrade() -> None:
+    op.create_table('task_events',
+                    sa.Column('event_id', sa.BigInteger(), autoincrement=True, nullable=False),
+                    sa.Column('task_id', sa.Integer(), nullable=False),
+                    sa.Column('kind', sa.String(length=32), nullable=False),
+                    sa.Column('data', sa.JSON(), nullable=True),
+                    sa.Column('user_ids', postgresql.ARRAY(sa.Integer()), nullable=False),
+                    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+                    sa.PrimaryKeyConstraint('event_id'))
+    op.create_index('ix_task_events_user_ids', 'task_events', ['user_ids'], postgresql_using='gin')
+    op.execute(TRIGGER)
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER task_events_notify ON task_events')
+    op.execute('DROP FUNCTION task_events_notify()')
+    op.drop_index('ix_task_events_user_ids', table_name='task_events', postgresql_using='gin')
+    op.drop_table('task_events')
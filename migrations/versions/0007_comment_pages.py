@@ -0,0 +1,29 @@
+"""Index of comments in per-task page order
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, Sequence[str], None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Composite index replaces single column one, task_id is its first column
+    op.create_index('ix_comments_task_id_timestamp', 'comments', ['task_id', 'timestamp', 'comment_id'])
+    op.drop_index('ix_comments_task_id', table_name='comments')
+
+
+def downgrade() -> None:
+    op.create_index('ix_comments_task_id', 'comments', ['task_id'])
+    op.drop_index('ix_comments_task_id_timestamp', table_name='comments')
@@ -0,0 +1,35 @@
+"""Soft delete of users and progress of background purge
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, Sequence[str], None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_table('user_purges',
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('tasks_total', sa.Integer(), nullable=False),
+                    sa.Column('tasks_deleted', sa.Integer(), server_default=sa.text('0'), nullable=False),
+                    sa.Column('started_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+                    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+                    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+                    sa.PrimaryKeyConstraint('user_id'))
+
+
+def downgrade() -> None:
+    op.drop_table('user_purges')
+    op.drop_column('users', 'deleted_at')
@@ -0,0 +1,38 @@
+"""User roles, token versions and revoked tokens
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009'
+down_revision: Union[str, Sequence[str], None] = '0008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('role', sa.String(length=16), server_default=sa.text("'user'"), nullable=False))
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default=sa.text('1'), nullable=False))
+    op.create_check_constraint('ck_users_role', 'users', "role IN ('user', 'admin')")
+    op.create_table('token_revocations',
+                    sa.Column('revocation_id', sa.BigInteger(), autoincrement=True, nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('jti', sa.String(length=32), nullable=True),
+                    sa.Column('token_version', sa.Integer(), nullable=True),
+                    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+                    sa.PrimaryKeyConstraint('revocation_id'))
+
+
+def downgrade() -> None:
+    op.drop_table('token_revocations')
+    op.drop_constraint('ck_users_role', 'users', type_='check')
+    op.drop_column('users', 'token_version')
+    op.drop_column('users', 'role')
@@ -0,0 +1,138 @@
+"""Task counters changed through append-only deltas
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0010'
+down_revision: Union[str, Sequence[str], None] = '0009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Triggers of migration 0005 updated shared counter rows in the order rows
+# were changed, so opposite status changes and multi-row deletes deadlocked.
+# Triggers now only insert deltas (rows with user_id NULL are deltas of
+# task_status_totals). task_counts_compact() moves them to counter tables,
+# in key order and one compaction at a time, readers add pending deltas
+TRIGGERS = """
+CREATE OR REPLACE FUNCTION user_task_counts_add(p_user_id integer, p_role text, p_status text, p_delta integer)
+RETURNS void AS $$
+    INSERT INTO task_count_deltas (user_id, role, status, delta) VALUES (p_user_id, p_role, p_status, p_delta);
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION tasks_count() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        INSERT INTO task_count_deltas (status, delta) VALUES (OLD.status, -1);
+        PERFORM user_task_counts_add(OLD.owner_id, 'owner', OLD.status, -1);
+        PERFORM user_task_counts_add(a.user_id, 'assignee', OLD.status, -1)
+        FROM user_task_association a WHERE a.task_id = OLD.task_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO task_count_deltas (status, delta) VALUES (NEW.status, 1);
+        PERFORM user_task_counts_add(NEW.owner_id, 'owner', NEW.status, 1);
+        PERFORM user_task_counts_add(a.user_id, 'assignee', NEW.status, 1)
+        FROM user_task_association a WHERE a.task_id = NEW.task_id;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION task_counts_compact() RETURNS integer AS $$
+DECLARE
+    moved integer;
+BEGIN
+    -- One compaction at a time, so counter rows have a single writer
+    IF NOT pg_try_advisory_xact_lock(hashtext('task_counts_compact')) THEN
+        RETURN 0;
+    END IF;
+    WITH deleted AS (
+        DELETE FROM task_count_deltas RETURNING user_id, role, status, delta
+    ), sums AS (
+        SELECT user_id, role, status, sum(delta)::integer AS delta FROM deleted GROUP BY user_id, role, status
+    ), totals AS (
+        UPDATE task_status_totals t SET count = t.count + s.delta FROM sums s
+        WHERE s.user_id IS NULL AND t.status = s.status
+    ), counts AS (
+        -- Users are locked before their counters in user ID order, so user
+        -- being deleted (cascade to counters) is waited for. Deltas of
+        -- deleted users are dropped
+        INSERT INTO user_task_counts (user_id, role, status, count)
+        SELECT s.user_id, s.role, s.status, s.delta FROM sums s JOIN users u ON u.user_id = s.user_id
+        ORDER BY s.user_id, s.role, s.status FOR KEY SHARE OF u
+        ON CONFLICT (user_id, role, status) DO UPDATE SET count = user_task_counts.count + EXCLUDED.count
+    )
+    SELECT count(*) INTO moved FROM sums;
+    RETURN moved;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+# Functions of migration 0005
+OLD_TRIGGERS = """
+CREATE OR REPLACE FUNCTION user_task_counts_add(p_user_id integer, p_role text, p_status text, p_delta integer)
+RETURNS void AS $$
+BEGIN
+    IF p_delta > 0 THEN
+        INSERT INTO user_task_counts (user_id, role, status, count) VALUES (p_user_id, p_role, p_status, p_delta)
+        ON CONFLICT (user_id, role, status) DO UPDATE SET count = user_task_counts.count + EXCLUDED.count;
+    ELSE
+        UPDATE user_task_counts SET count = count + p_delta
+        WHERE user_id = p_user_id AND role = p_role AND status = p_status;
+    END IF;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION tasks_count() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE task_status_totals SET count = count - 1 WHERE status = OLD.status;
+        PERFORM user_task_counts_add(OLD.owner_id, 'owner', OLD.status, -1);
+        PERFORM user_task_counts_add(a.user_id, 'assignee', OLD.status, -1)
+        FROM user_task_association a WHERE a.task_id = OLD.task_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE task_status_totals SET count = count + 1 WHERE status = NEW.status;
+        PERFORM user_task_counts_add(NEW.owner_id, 'owner', NEW.status, 1);
+        PERFORM user_task_counts_add(a.user_id, 'assignee', NEW.status, 1)
+        FROM user_task_association a WHERE a.task_id = NEW.task_id;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade() -> None:
+    op.create_table('task_count_deltas',
+                    sa.Column('delta_id', sa.BigInteger(), autoincrement=True, nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=True),
+                    sa.Column('role', sa.String(length=16), nullable=True),
+                    sa.Column('status', sa.String(length=16), nullable=False),
+                    sa.Column('delta', sa.Integer(), nullable=False),
+                    sa.PrimaryKeyConstraint('delta_id'))
+    op.create_index('ix_task_count_deltas_user_id', 'task_count_deltas', ['user_id'])
+    op.execute(TRIGGERS)
+
+
+def downgrade() -> None:
+    op.execute('LOCK TABLE tasks, user_task_association IN SHARE MODE')
+    op.execute('SELECT task_counts_compact()')
+    op.execute('DROP FUNCTION task_counts_compact()')
+    op.execute(OLD_TRIGGERS)
+    op.drop_index('ix_task_count_deltas_user_id', table_name='task_count_deltas')
+    op.drop_table('task_count_deltas')
@@ -0,0 +1,46 @@
+"""Generation of token revocations
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0011'
+down_revision: Union[str, Sequence[str], None] = '0010'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Revocation IDs are allocated before commit, so count and maximum ID of rows
+# don't tell reliably whether rows were added. Generation is bumped in the
+# same transaction as the insert, worker which sees new generation reloads
+TRIGGER = """
+CREATE FUNCTION token_revocations_bump() RETURNS trigger AS $$
+BEGIN
+    UPDATE token_revocations_generation SET generation = generation + 1;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER token_revocations_bump AFTER INSERT ON token_revocations
+FOR EACH STATEMENT EXECUTE FUNCTION token_revocations_bump();
+"""
+
+
+def upgrade() -> None:
+    op.create_table('token_revocations_generation',
+                    sa.Column('generation', sa.BigInteger(), server_default=sa.text('0'), nullable=False))
+    op.execute('INSERT INTO token_revocations_generation DEFAULT VALUES')
+    op.execute(TRIGGER)
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER token_revocations_bump ON token_revocations')
+    op.execute('DROP FUNCTION token_revocations_bump()')
+    op.drop_table('token_revocations_generation')
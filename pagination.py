@@ -0,0 +1,113 @@
+from fastapi import HTTPException
+from sqlalchemy.orm import InstrumentedAttribute
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Select, tuple_
+from typing import Literal, Optional
+import base64
+import binascii
+import datetime
+import json
+
+# Page size limits shared by every paginated endpoint
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+SortOrder = Literal['asc', 'desc']
+
+# Primary keys are PostgreSQL integer, larger IDs in tampered cursors would
+# fail in the driver instead of returning 400
+MAX_ID = 2 ** 31 - 1
+
+
+def pack_cursor(data: dict) -> str:
+    """Pack position of the last seen row into opaque url-safe cursor"""
+    raw = json.dumps(data, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def unpack_cursor(cursor: str) -> dict:
+    """Inverse of pack_cursor(). If cursor is malformed then raise HTTPException"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    return data
+
+def load_id(value) -> int:
+    """Return primary key from cursor value. Raise ValueError if it is out of range"""
+    row_id = int(value)
+    if not 1 <= row_id <= MAX_ID:
+        raise ValueError(f'ID out of range: {row_id}')
+    return row_id
+
+def encode_cursor(last_id: int, order: SortOrder) -> str:
+    """Pack last seen primary key into opaque url-safe cursor"""
+    return pack_cursor({'id': last_id, 'order': order})
+
+def decode_cursor(cursor: Optional[str], order: SortOrder) -> Optional[int]:
+    """Return last seen primary key from cursor. If cursor is malformed or was
+    created for different sort order then raise HTTPException"""
+    if cursor is None:
+        return None
+    data = unpack_cursor(cursor)
+    try:
+        last_id, cursor_order = load_id(data['id']), data['order']
+    except (ValueError, KeyError, TypeError, OverflowError):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    if cursor_order != order:
+        raise HTTPException(status_code=400, detail='Cursor does not match requested sort order')
+    return last_id
+
+async def paginate(instance: AsyncSession, query: Select, key: InstrumentedAttribute,
+                   limit: int, cursor: Optional[str], order: SortOrder):
+    """Apply keyset condition and ordering on key column to query. Returns list
+    of rows for this page and cursor for the next one (None on the last page)"""
+    last_id = decode_cursor(cursor, order)
+    if last_id is not None:
+        query = query.where(key > last_id if order == 'asc' else key < last_id)
+    # Fetching one extra row tells if there is next page without COUNT(*)
+    query = query.order_by(key.asc() if order == 'asc' else key.desc()).limit(limit + 1)
+    rows = (await instance.execute(query)).scalars().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(getattr(rows[-1], key.key), order)
+    return rows, next_cursor
+
+def _dump_key(value):
+    return value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else value
+
+def _load_key(column: InstrumentedAttribute, value):
+    python_type = column.type.python_type
+    if python_type in (datetime.date, datetime.datetime):
+        return python_type.fromisoformat(value)
+    if python_type is int:
+        return load_id(value)
+    return python_type(value)
+
+async def paginate_keyset(instance: AsyncSession, query: Select, keys: tuple,
+                          limit: int, cursor: Optional[str], order: SortOrder):
+    """paginate() for key of several columns, e.g. (timestamp, comment_id).
+    Last column must be unique. Rows are compared as row values, so index on
+    the key columns (after equality filtered ones) serves every page"""
+    position = None
+    if cursor is not None:
+        data = unpack_cursor(cursor)
+        try:
+            position = tuple(_load_key(key, value) for key, value in zip(keys, data['key'], strict=True))
+            cursor_order = data['order']
+        except (ValueError, KeyError, TypeError, OverflowError):
+            raise HTTPException(status_code=400, detail='Invalid cursor')
+        if cursor_order != order:
+            raise HTTPException(status_code=400, detail='Cursor does not match requested sort order')
+    if position is not None:
+        query = query.where(tuple_(*keys) > position if order == 'asc' else tuple_(*keys) < position)
+    query = query.order_by(*(key.asc() if order == 'asc' else key.desc() for key in keys)).limit(limit + 1)
+    rows = (await instance.execute(query)).scalars().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = pack_cursor({'key': [_dump_key(getattr(rows[-1], key.key)) for key in keys], 'order': order})
+    return rows, next_cursor
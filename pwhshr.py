@@ -1,7 +1,60 @@
 from sqlalchemy import TypeDecorator, VARCHAR
 from pydantic import GetCoreSchemaHandler
 from pydantic_core import core_schema
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import weakref
+import time
 import bcrypt
+import os
+from dotenv import load_dotenv
+import metrics
+
+load_dotenv(override=True)
+# Cost used for new hashes. Stored hashes with different cost are rehashed on login
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+# Number of processes computing hashes and maximum number of hashing jobs in
+# flight. Requests above the limit wait for free slot instead of queueing work
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', os.cpu_count() or 1))
+BCRYPT_MAX_CONCURRENCY = int(os.getenv('BCRYPT_MAX_CONCURRENCY', 2 * BCRYPT_WORKERS))
+
+_pool: ProcessPoolExecutor | None = None
+# Semaphore binds to event loop which first waits on it, so every loop (test
+# clients, reloads) gets its own
+_slots: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Create worker pool on first use"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=BCRYPT_WORKERS)
+    return _pool
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+def _get_slots() -> asyncio.Semaphore:
+    """Create limit of hashing jobs of the running loop on first use"""
+    loop = asyncio.get_running_loop()
+    if loop not in _slots:
+        _slots[loop] = asyncio.Semaphore(BCRYPT_MAX_CONCURRENCY)
+    return _slots[loop]
+
+async def _run_in_pool(func, *args):
+    async with _get_slots():
+        return await asyncio.get_running_loop().run_in_executor(_get_pool(), func, *args)
+
+# Functions executed in worker processes, must be importable at module level
+def _hashpw(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+def _checkpw(plain_password: bytes, hashed_password: bytes) -> bool:
+    return bcrypt.checkpw(plain_password, hashed_password)
+
 
 class PasswordHash():
     def __init__(self, hash):
@@ -14,17 +67,42 @@ class PasswordHash():
         return f'<{type(self).__name__}>'
 
     @classmethod
-    def new(cls, password: str, rounds: int = 12):
-        return cls(bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode())
+    def new(cls, password: str, rounds: int = BCRYPT_ROUNDS):
+        return cls(_hashpw(password.encode(), rounds).decode())
     
     @staticmethod
     def check(plain_password: str, hashed_password: str):
-        return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
+        start = time.perf_counter()
+        try:
+            return _checkpw(plain_password.encode(), hashed_password.encode())
+        finally:
+            metrics.bcrypt_duration.observe(time.perf_counter() - start, 'check')
+
+    # Async variants run bcrypt in worker pool, use them in endpoints so
+    # hashing does not block event loop
+    @classmethod
+    async def new_async(cls, password: str, rounds: int = BCRYPT_ROUNDS):
+        start = time.perf_counter()
+        try:
+            return cls((await _run_in_pool(_hashpw, password.encode(), rounds)).decode())
+        finally:
+            metrics.bcrypt_duration.observe(time.perf_counter() - start, 'hash')
+
+    @staticmethod
+    async def check_async(plain_password: str, hashed_password: str):
+        start = time.perf_counter()
+        try:
+            return await _run_in_pool(_checkpw, plain_password.encode(), hashed_password.encode())
+        finally:
+            metrics.bcrypt_duration.observe(time.perf_counter() - start, 'check')
+
+    def needs_rehash(self, rounds: int = BCRYPT_ROUNDS) -> bool:
+        return self.rounds != rounds
 
 class Password(TypeDecorator):
     impl = VARCHAR
 
-    def __init__(self, rounds=12, **kwargs):
+    def __init__(self, rounds=BCRYPT_ROUNDS, **kwargs):
         self.rounds = rounds
         super().__init__(**kwargs)
 
@@ -47,6 +125,8 @@ class Password(TypeDecorator):
         if isinstance(value, PasswordHash):
             return value
         elif isinstance(value, str):
+            # NOTE: Hashing here blocks the caller, endpoints should pass
+            # PasswordHash created with PasswordHash.new_async
             return PasswordHash.new(value, self.rounds)
         elif value is not None:
             raise TypeError(f'Cannot convert {type(value)} to a PasswordHash')
@@ -0,0 +1,155 @@
+from fastapi import Depends, HTTPException, Request, status
+from typing import Annotated, NamedTuple, Optional
+import hashlib
+import logging
+import math
+import time
+import os
+from dotenv import load_dotenv
+
+import metrics
+from cache import TTLCache, REDIS_URL
+from security import oauth2_scheme
+
+load_dotenv(override=True)
+# Token bucket rate limiting. Limits are '<requests>/<second|minute|hour>',
+# bucket holds that many requests and refills at the same rate. Empty value
+# or 0 disables limiter. Backend is 'memory' (per worker, default) or 'redis'
+# (shared between workers, requires redis package)
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_SIZE = int(os.getenv('RATE_LIMIT_SIZE', 100000))
+# /token attempts are limited before user is loaded and password is checked
+LOGIN_RATE_LIMIT_EMAIL = os.getenv('LOGIN_RATE_LIMIT_EMAIL', '5/minute')
+LOGIN_RATE_LIMIT_IP = os.getenv('LOGIN_RATE_LIMIT_IP', '30/minute')
+# Requests of authenticated routes per access token
+API_RATE_LIMIT = os.getenv('API_RATE_LIMIT', '100/second')
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600}
+
+log = logging.getLogger('tms.ratelimit')
+
+
+class Rate(NamedTuple):
+    capacity: int
+    per_second: float
+
+def parse_rate(value: str) -> Optional[Rate]:
+    """Parse '<requests>/<period>', None when limit is disabled"""
+    value = value.strip()
+    if value in ('', '0'):
+        return None
+    requests, _, period = value.partition('/')
+    if period not in PERIODS or not requests.isdigit():
+        raise ValueError(f'Invalid rate limit: {value!r}, expected <requests>/<second|minute|hour>')
+    if int(requests) == 0:
+        return None
+    return Rate(int(requests), int(requests) / PERIODS[period])
+
+
+# Backends take one token from bucket of key and return 0 when request is
+# allowed, otherwise seconds until the next token is available
+
+class MemoryBackend():
+    """Buckets kept in process. Bucket expires when it would be full again,
+    so only recently limited keys take memory"""
+    def __init__(self, rate: Rate, maxsize: int = RATE_LIMIT_SIZE):
+        self.rate = rate
+        self.buckets = TTLCache(maxsize=maxsize, ttl=rate.capacity / rate.per_second)
+
+    async def acquire(self, key: str) -> float:
+        now = time.monotonic()
+        # (tokens, time of update), no await between read and write
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            tokens = self.rate.capacity
+        else:
+            tokens = min(self.rate.capacity, bucket[0] + (now - bucket[1]) * self.rate.per_second)
+        if tokens < 1:
+            return (1 - tokens) / self.rate.per_second
+        self.buckets.set(key, (tokens - 1, now))
+        return 0.0
+
+
+# Bucket is updated atomically by server, with server clock
+ACQUIRE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local per_second = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = capacity
+if bucket[1] then
+    tokens = math.min(capacity, tonumber(bucket[1]) + (now - tonumber(bucket[2])) * per_second)
+end
+if tokens < 1 then
+    return tostring((1 - tokens) / per_second)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / per_second * 1000))
+return '0'
+"""
+
+class RedisBackend():
+    """Buckets shared by all workers. Client can be passed explicitly, e.g.
+    fakeredis.FakeAsyncRedis in tests"""
+    def __init__(self, rate: Rate, client=None, url: str = REDIS_URL, prefix: str = 'tms:ratelimit:'):
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError('Redis rate limit backend requires redis package (pip install redis)')
+            client = redis.from_url(url)
+        self.rate = rate
+        self.client = client
+        self.prefix = prefix
+        self.script = client.register_script(ACQUIRE_SCRIPT)
+
+    async def acquire(self, key: str) -> float:
+        try:
+            return float(await self.script(keys=[self.prefix + key], args=[self.rate.capacity, self.rate.per_second]))
+        except Exception as exc:
+            # Unavailable limiter must not take logins down with it
+            log.warning('Rate limit backend failed, request allowed: %s', exc)
+            return 0.0
+
+
+class RateLimiter():
+    def __init__(self, name: str, backend):
+        self.name = name
+        self.backend = backend
+
+    async def check(self, key: str):
+        """Take one request of key or raise HTTPException 429 with Retry-After"""
+        wait = await self.backend.acquire(key)
+        if wait > 0:
+            metrics.rate_limit_rejected.inc(self.name)
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail='Too many requests',
+                                headers={'Retry-After': str(math.ceil(wait))})
+
+def create_limiter(name: str, rate: str, backend: str = RATE_LIMIT_BACKEND) -> Optional[RateLimiter]:
+    rate = parse_rate(rate)
+    if rate is None:
+        return None
+    if backend == 'redis':
+        return RateLimiter(name, RedisBackend(rate, prefix=f'tms:ratelimit:{name}:'))
+    if backend == 'memory':
+        return RateLimiter(name, MemoryBackend(rate))
+    raise ValueError(f'Unknown rate limit backend: {backend}')
+
+login_email_limiter = create_limiter('login_email', LOGIN_RATE_LIMIT_EMAIL)
+login_ip_limiter = create_limiter('login_ip', LOGIN_RATE_LIMIT_IP)
+api_token_limiter = create_limiter('api_token', API_RATE_LIMIT)
+
+
+async def limit_login(request: Request, email: str):
+    """Limit login attempts by client address and by email. Client address is
+    the peer address, behind proxy run uvicorn with --forwarded-allow-ips"""
+    if login_ip_limiter is not None and request.client is not None:
+        await login_ip_limiter.check(request.client.host)
+    if login_email_limiter is not None:
+        await login_email_limiter.check(email.strip().lower())
+
+async def limit_token(token: Annotated[str, Depends(oauth2_scheme)]):
+    """Dependency of authenticated routes, runs before token is decoded"""
+    if api_token_limiter is not None:
+        await api_token_limiter.check(hashlib.blake2b(token.encode(), digest_size=16).hexdigest())
@@ -0,0 +1,174 @@
+from sqlalchemy import event, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from typing import Optional
+import asyncio
+import datetime
+import hashlib
+import logging
+import math
+import time
+import os
+from dotenv import load_dotenv
+import db
+
+load_dotenv(override=True)
+# Revoked access tokens. Every worker keeps revocations in memory and reloads
+# them from token_revocations table, so tokens are checked without database.
+# Token revoked by other worker is accepted until the next refresh
+TOKEN_REVOCATIONS_REFRESH = float(os.getenv('TOKEN_REVOCATIONS_REFRESH', 5))
+# Filter is sized so that at most this fraction of tokens is looked up in the
+# exact set
+TOKEN_REVOCATIONS_ERROR_RATE = float(os.getenv('TOKEN_REVOCATIONS_ERROR_RATE', 0.01))
+
+# List not refreshed for this long is stale, tokens are then checked in database
+MAX_AGE_REFRESHES = 3
+PURGE_INTERVAL = 3600
+
+log = logging.getLogger('tms.revocations')
+
+
+class BloomFilter():
+    """Set membership with false positives but no false negatives, positions
+    of key are derived from one blake2b digest (double hashing)"""
+    def __init__(self, capacity: int, error_rate: float = TOKEN_REVOCATIONS_ERROR_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList():
+    """Revoked token IDs (jti) and minimal token version of users with
+    revoked tokens. Token IDs pass bloom filter first, so the exact set is
+    consulted only for revoked tokens and rare false positives"""
+    def __init__(self):
+        self.filter = BloomFilter(0)
+        self.tokens: set = set()
+        self.user_versions: dict[int, int] = {}
+        self.loaded_at: Optional[float] = None
+        self._generation = None
+
+    def rebuild(self, rows):
+        """Replace content with (jti, user_id, token_version) rows"""
+        tokens, user_versions = set(), {}
+        for jti, user_id, token_version in rows:
+            if jti is not None:
+                tokens.add(jti)
+            if token_version is not None:
+                user_versions[user_id] = max(token_version, user_versions.get(user_id, 0))
+        # Room for tokens revoked by this worker before the next rebuild
+        bloom = BloomFilter(max(2 * len(tokens), 1024))
+        for jti in tokens:
+            bloom.add(jti)
+        self.filter, self.tokens, self.user_versions = bloom, tokens, user_versions
+
+    def add_token(self, jti: str):
+        self.filter.add(jti)
+        self.tokens.add(jti)
+
+    def add_user(self, user_id: int, token_version: int):
+        self.user_versions[user_id] = max(token_version, self.user_versions.get(user_id, 0))
+
+    def is_revoked(self, jti: str, user_id: int, token_version: int) -> bool:
+        if token_version < self.user_versions.get(user_id, 0):
+            return True
+        return jti in self.filter and jti in self.tokens
+
+    def is_current(self) -> bool:
+        return self.loaded_at is not None and \
+               time.monotonic() - self.loaded_at < MAX_AGE_REFRESHES * TOKEN_REVOCATIONS_REFRESH
+
+    async def refresh(self):
+        """Reload revocations when their generation changed, checked with one
+        small query. Generation is read first, so rows committed in between
+        are loaded now or on the next refresh"""
+        revocations = db.token_revocations.c
+        async with db.AsyncSessionLocal() as instance:
+            generation = (await instance.execute(db.select(db.token_revocations_generation.c.generation))).scalar()
+            if generation != self._generation:
+                rows = (await instance.execute(db.select(revocations.jti, revocations.user_id, revocations.token_version)
+                                               .where(revocations.expires_at > db.func.now()))).all()
+                self.rebuild(rows)
+                self._generation = generation
+        self.loaded_at = time.monotonic()
+
+revocation_list = RevocationList()
+
+
+# Revocations reach the list of this worker only when transaction commits.
+# Rolled back revocation (e.g. update of user failed) must not lock user out
+PENDING = 'pending_revocations'
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending(session: Session):
+    for add, *args in session.info.pop(PENDING, ()):
+        add(*args)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session: Session):
+    session.info.pop(PENDING, None)
+
+def _add_after_commit(instance: AsyncSession, add, *args):
+    instance.info.setdefault(PENDING, []).append((add, *args))
+
+async def revoke_token(instance: AsyncSession, jti: str, user_id: int, expires_at: datetime.datetime):
+    """Revoke one token in current transaction"""
+    await instance.execute(db.insert(db.token_revocations).values(user_id=user_id, jti=jti, expires_at=expires_at))
+    _add_after_commit(instance, revocation_list.add_token, jti)
+
+async def revoke_user(instance: AsyncSession, user_id: int, lifetime: datetime.timedelta):
+    """Revoke all tokens of user issued so far in current transaction.
+    lifetime is the longest lifetime of issued tokens"""
+    query = db.update(db.UserT).where(db.UserT.user_id == user_id) \
+              .values(token_version=db.UserT.token_version + 1).returning(db.UserT.token_version) \
+              .execution_options(synchronize_session=False)
+    token_version = (await instance.execute(query)).scalar()
+    if token_version is None:
+        return
+    await instance.execute(db.insert(db.token_revocations).values(user_id=user_id, token_version=token_version,
+                                                                  expires_at=db.func.now() + lifetime))
+    _add_after_commit(instance, revocation_list.add_user, user_id, token_version)
+
+async def is_revoked(jti: str, user_id: int, token_version: int, instance: AsyncSession) -> bool:
+    """Check token in memory, or in database when the list is stale"""
+    if revocation_list.is_current():
+        return revocation_list.is_revoked(jti, user_id, token_version)
+    revocations = db.token_revocations.c
+    query = db.select(or_(db.exists().where(revocations.jti == jti),
+                          db.exists().where(revocations.user_id == user_id,
+                                            revocations.token_version > token_version)))
+    return (await instance.execute(query)).scalar()
+
+async def purge():
+    """Delete revocations of tokens which already expired"""
+    async with db.AsyncSessionLocal() as instance:
+        await instance.execute(db.delete(db.token_revocations)
+                               .where(db.token_revocations.c.expires_at < db.func.now()))
+        await instance.commit()
+
+async def keep_fresh():
+    """Refresh revocation list every TOKEN_REVOCATIONS_REFRESH seconds, runs
+    until cancelled"""
+    purged = 0.0
+    while True:
+        try:
+            await revocation_list.refresh()
+            if time.monotonic() - purged > PURGE_INTERVAL:
+                await purge()
+                purged = time.monotonic()
+        except Exception as exc:
+            log.warning('Refresh of revoked tokens failed: %s', exc)
+        await asyncio.sleep(TOKEN_REVOCATIONS_REFRESH)
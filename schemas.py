@@ -1,6 +1,6 @@
 from fastapi import FastAPI, HTTPException, Depends
 from pydantic import BaseModel, Field, model_serializer
-from typing import Optional, List
+from typing import Optional, List, Literal
 import datetime
 from sqlalchemy.orm import Session
 import db
@@ -26,6 +26,11 @@ class User(UserWithID):
     assigned_tasks: Optional[List[AssignedTasks]] = Field(None, description='Tasks assigned to user')
 
 
+class UserPage(BaseModel):
+    items: List[User] = Field(..., description='Users on this page')
+    next_cursor: Optional[str] = Field(None, description='Cursor for the next page. Empty on the last page')
+
+
 class UserCreate(UserBase):
     pass
 
@@ -47,21 +52,55 @@ class TaskBase(BaseModel):
     title: str = Field(...,min_length=5, max_length=512, description='Title of a task')
     description: Optional[str] = Field(None, description='Description of a task')
     
-class Task(TaskBase):
+class TaskWithID(TaskBase):
     task_id: int = Field(..., description='ID of a task')
     owner_id: int = Field(..., description='ID of the user who created this task')
     start_date: Optional[datetime.date] = Field(None, description='Task start date. '
                                                 'The default start date is the date task was created')
     end_date: Optional[datetime.date] = Field(None, description='Task end date')
+    status: db.TaskStatus = Field('open', description='Task status')
+
+class Task(TaskWithID):
     comments: Optional[List['Comment']] = Field(None, description='Task comments created by users')
     assigned_users: Optional[List['UserWithID']] = Field(None, description='Users assigned to the task')
 
+# Summary representation (view=summary) with counts instead of nested lists
+TaskView = Literal['full', 'summary']
+
+class TaskBrief(TaskWithID):
+    comment_count: int = Field(..., description='Number of comments of the task')
+    last_comment_at: Optional[datetime.datetime] = Field(None, description='Time of the latest comment')
+    assignee_count: int = Field(..., description='Number of users assigned to the task')
+
+class TaskPage(BaseModel):
+    items: List[Task] = Field(..., description='Tasks on this page')
+    next_cursor: Optional[str] = Field(None, description='Cursor for the next page. Empty on the last page')
+
+class TaskBriefPage(BaseModel):
+    items: List[TaskBrief] = Field(..., description='Tasks on this page')
+    next_cursor: Optional[str] = Field(None, description='Cursor for the next page. Empty on the last page')
+
+class TaskSearchPage(TaskPage):
+    match: Literal['fulltext', 'fuzzy'] = Field(..., description='Match mode used for this page')
+
+class TaskExport(Task):
+    updated_at: datetime.datetime = Field(..., description='Last change of the task, its comments or assigned users')
+
+class TaskTombstone(BaseModel):
+    task_id: int = Field(..., description='ID of a deleted task')
+    deleted_at: datetime.datetime = Field(..., description='Time the task was deleted')
+
 class TaskAdd(TaskBase):
     pass
 
 class TaskAssign(BaseModel):
     user_id: int = Field(..., description='ID of a assigned user')
 
+class TaskAssigneesChange(BaseModel):
+    task_id: int = Field(..., description='ID of a task')
+    added: List[int] = Field(..., description='Users assigned by this request')
+    removed: List[int] = Field(..., description='Users unassigned by this request')
+
 class TaskUpdate(BaseModel):
     title: Optional[str] = Field(None, min_length=5, max_length=512, description='Title of a task')
     description: Optional[str] = Field(None, description='Description of a task')
@@ -69,8 +108,36 @@ class TaskUpdate(BaseModel):
     start_date: Optional[datetime.date] = Field(None, description='Task start date. '
                                                 'The default start date is the date task was created')
     end_date: Optional[datetime.date] = Field(None, description='Task end date')
+    status: Optional[db.TaskStatus] = Field(None, description='Task status. Only allowed transitions are accepted, '
+                                            'e.g. done task can be only reopened (in_progress)')
     #assigned_users: Optional[List['User']] = Field(None, description='Users assigned to the task')
 
+class StatusCounts(BaseModel):
+    open: int = Field(0, description='Number of open tasks')
+    in_progress: int = Field(0, description='Number of tasks in progress')
+    done: int = Field(0, description='Number of done tasks')
+    cancelled: int = Field(0, description='Number of cancelled tasks')
+
+class TaskSummary(BaseModel):
+    counts: StatusCounts = Field(..., description='Number of tasks in every status')
+    overdue: int = Field(..., description='Open or in progress tasks with end date in the past')
+
+class UserPurge(BaseModel):
+    user_id: int = Field(..., description='ID of the deleted user')
+    tasks_total: int = Field(..., description='Tasks owned by the user when deletion was requested')
+    tasks_deleted: int = Field(..., description='Tasks deleted so far')
+    started_at: datetime.datetime = Field(..., description='Time of the deletion request')
+    updated_at: datetime.datetime = Field(..., description='Time of the last deleted batch')
+    finished_at: Optional[datetime.datetime] = Field(None, description='Time when the user was deleted. '
+                                                                      'Empty while the purge is running')
+
+class UserTaskSummary(BaseModel):
+    user_id: int = Field(..., description='ID of the user')
+    owned: StatusCounts = Field(..., description='Tasks created by the user')
+    assigned: StatusCounts = Field(..., description='Tasks the user is assigned to')
+    overdue_owned: int = Field(..., description='Overdue tasks created by the user')
+    overdue_assigned: int = Field(..., description='Overdue tasks the user is assigned to')
+
 class TaskDelete(Task):
     detail: str = Field(default='The task deletion operation has been performed successfully. '
                                 'The task comments were deleted along with the task.', 
@@ -87,6 +154,10 @@ class CommentBase(BaseModel):
 class Comment(CommentBase):
     comment_id: int = Field(..., description='ID of a comment')
 
+class CommentPage(BaseModel):
+    items: List[Comment] = Field(..., description='Comments on this page')
+    next_cursor: Optional[str] = Field(None, description='Cursor for the next page. Empty on the last page')
+
 class CommentUpdate(BaseModel):
     timestamp: Optional[datetime.datetime] = Field(None, description='Date and time when comment was added')
     comment: Optional[str] = Field(None, description='Comment body')
@@ -95,3 +166,31 @@ class CommentDelete(Comment):
     detail: str = Field(default='Comment deletion operation has been performed successfully.',
                         description='Information about succesfull operation')
 
+
+
+# Bulk operation models
+
+class UserBulkCreate(UserBase):
+    email: str = Field(..., description='User email adress')
+    password: str = Field(..., min_length=1, description='Plain text password, stored as bcrypt hash')
+
+class TaskBulkCreate(TaskBase):
+    user_id: int = Field(..., description='ID of the user who creates this task')
+
+class TaskBulkAssign(BaseModel):
+    task_id: int = Field(..., description='ID of a task')
+    user_id: int = Field(..., description='ID of a assigned user')
+
+class CommentBulkCreate(BaseModel):
+    user_id: int = Field(..., description='ID of a user')
+    task_id: int = Field(..., description='ID of a commented task')
+    comment: str = Field(..., description='Comment body')
+
+class BulkItemResult(BaseModel):
+    index: int = Field(..., description='Position of the item in request')
+    id: Optional[int] = Field(None, description='ID of created row. Empty for rejected items and assignments')
+    error: Optional[str] = Field(None, description='Reason why item was rejected')
+
+class BulkResult(BaseModel):
+    created: int = Field(..., description='Number of created rows')
+    results: List[BulkItemResult] = Field(..., description='Result for every item in request order')
@@ -0,0 +1,79 @@
+from fastapi import HTTPException
+from sqlalchemy import and_, or_, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Literal, Optional
+import db
+from pagination import pack_cursor, unpack_cursor, load_id
+
+# Task search. Full-text match uses tsvector columns of tasks and comments
+# (GIN indexed), fuzzy match compares titles with pg_trgm (trigram index)
+
+SearchMatch = Literal['auto', 'fulltext', 'fuzzy']
+
+
+def _fulltext_ranked(phrase: str):
+    """Select task IDs with rank. Task matches by its title and description or by
+    any of its comments, best matching comment adds to the rank. Candidates are
+    union of both matches, so each side is found with its GIN index and only
+    matching rows are ranked"""
+    query = db.func.websearch_to_tsquery(db.SEARCH_CONFIG, phrase)
+    tasks = db.select(db.TaskT.task_id.label('task_id'),
+                      db.func.ts_rank(db.TaskT.search_vector, query).label('rank')) \
+              .where(db.TaskT.search_vector.bool_op('@@')(query))
+    comments = db.select(db.CommentT.task_id.label('task_id'),
+                         db.func.max(db.func.ts_rank(db.CommentT.search_vector, query)).label('rank')) \
+                 .where(db.CommentT.search_vector.bool_op('@@')(query)) \
+                 .group_by(db.CommentT.task_id)
+    matches = union_all(tasks, comments).subquery()
+    return db.select(matches.c.task_id, db.func.sum(matches.c.rank).label('rank')).group_by(matches.c.task_id)
+
+def _fuzzy_ranked(phrase: str):
+    """Select task IDs with rank for titles similar to phrase or starting with
+    it. Similarity limit is pg_trgm.similarity_threshold setting (default 0.3)"""
+    prefix = phrase.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    rank = db.func.similarity(db.TaskT.title, phrase).label('rank')
+    return db.select(db.TaskT.task_id, rank) \
+             .where(or_(db.TaskT.title.bool_op('%')(phrase), db.TaskT.title.ilike(prefix)))
+
+def _decode_search_cursor(cursor: Optional[str], match: SearchMatch):
+    """Return (match, rank, task_id) of the last seen row or None"""
+    if cursor is None:
+        return None
+    data = unpack_cursor(cursor)
+    try:
+        position = data['match'], float(data['rank']), load_id(data['id'])
+    except (ValueError, KeyError, TypeError, OverflowError):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    if position[0] not in ('fulltext', 'fuzzy') or match not in ('auto', position[0]):
+        raise HTTPException(status_code=400, detail='Cursor does not match requested match mode')
+    return position
+
+async def search_task_ids(instance: AsyncSession, phrase: str, match: SearchMatch,
+                          limit: int, cursor: Optional[str]):
+    """Return IDs of matching tasks ordered by rank, used match mode and cursor
+    for the next page. In 'auto' mode fuzzy match is used when full-text
+    search finds nothing. Pages are keyset paginated on (rank, task_id)"""
+    position = _decode_search_cursor(cursor, match)
+    if position is not None:
+        modes = [position[0]]
+    elif match == 'auto':
+        modes = ['fulltext', 'fuzzy']
+    else:
+        modes = [match]
+    for mode in modes:
+        query = (_fulltext_ranked(phrase) if mode == 'fulltext' else _fuzzy_ranked(phrase)).subquery()
+        ranked = db.select(query.c.task_id, query.c.rank)
+        if position is not None:
+            _, last_rank, last_id = position
+            ranked = ranked.where(or_(query.c.rank < last_rank,
+                                         and_(query.c.rank == last_rank, query.c.task_id > last_id)))
+        # Fetching one extra row tells if there is next page without COUNT(*)
+        ranked = ranked.order_by(query.c.rank.desc(), query.c.task_id.asc()).limit(limit + 1)
+        rows = (await instance.execute(ranked)).all()
+        if rows or mode == modes[-1]:
+            break
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = pack_cursor({'match': mode, 'rank': rows[-1].rank, 'id': rows[-1].task_id})
+    return [row.task_id for row in rows], mode, next_cursor
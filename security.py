@@ -1,15 +1,19 @@
 from datetime import datetime, timedelta, timezone
-from typing import Annotated
+from pathlib import Path
+from typing import Annotated, Optional
+import uuid
 import jwt
 from jwt import InvalidTokenError, ExpiredSignatureError
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi import Depends, HTTPException, status
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import os 
 from dotenv import load_dotenv
 
 import db
+import loaders
+import revocations
 from pwhshr import PasswordHash
 
 
@@ -17,6 +21,12 @@ load_dotenv(override=True)
 SECRET_KEY = os.getenv('SECRET_KEY')
 ALGORITHM = os.getenv('ALGORITHM')
 ACCESS_TOKEN_EXPIRE = int(os.getenv('ACCESS_TOKEN_EXPIRE'))
+# Asymmetric algorithms (RS256, ES256, EdDSA...) sign tokens with private key
+# and verify them with public keys <kid>.pem in JWT_PUBLIC_KEYS_DIR. Tokens
+# carry ID of signing key (JWT_KEY_ID) in kid header
+JWT_PRIVATE_KEY_FILE = os.getenv('JWT_PRIVATE_KEY_FILE')
+JWT_PUBLIC_KEYS_DIR = os.getenv('JWT_PUBLIC_KEYS_DIR')
+JWT_KEY_ID = os.getenv('JWT_KEY_ID')
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token')
 
@@ -36,20 +46,77 @@ class User(BaseModel):
 class UserInDB(User):
     hashed_password: str
 
-def get_user_by_email(email: str, instance: Session):
+class Principal(BaseModel):
+    """Authenticated user returned by get_current_user, built from claims
+    of access token without loading the user"""
+    user_id: int
+    username: str
+    email: str
+    role: str
+    # ID and expiration of the token, needed to revoke it
+    jti: str
+    expires_at: datetime
+
+
+class KeySet():
+    """Signing key and verification keys by key ID. PEM keys are parsed
+    once, when keys are loaded"""
+    def __init__(self, algorithm: str, signing_key, signing_kid: Optional[str], verification_keys: dict):
+        self.algorithm = algorithm
+        self.signing_key = signing_key
+        self.signing_kid = signing_kid
+        self.verification_keys = verification_keys
+
+    def encode(self, claims: dict) -> str:
+        headers = {'kid': self.signing_kid} if self.signing_kid else None
+        return jwt.encode(claims, self.signing_key, algorithm=self.algorithm, headers=headers)
+
+    def decode(self, token: str) -> dict:
+        """Verify token with key named by its kid header. Raises InvalidTokenError"""
+        key = self.verification_keys.get(jwt.get_unverified_header(token).get('kid'))
+        if key is None:
+            raise InvalidTokenError('Unknown signing key')
+        return jwt.decode(token, key, algorithms=[self.algorithm],
+                          options={'require': ['exp', 'sub', 'uid', 'name', 'role', 'tv', 'jti']})
+
+def load_key_set(algorithm: str = ALGORITHM) -> KeySet:
+    """HMAC algorithms use SECRET_KEY. To rotate asymmetric keys add public
+    key of the new key to JWT_PUBLIC_KEYS_DIR of every worker, then switch
+    JWT_PRIVATE_KEY_FILE and JWT_KEY_ID and remove the old public key after
+    ACCESS_TOKEN_EXPIRE minutes"""
+    try:
+        prepare_key = jwt.get_algorithm_by_name(algorithm).prepare_key
+    except NotImplementedError:
+        raise RuntimeError(f'Algorithm {algorithm} requires cryptography package (pip install "pyjwt[crypto]")')
+    if algorithm.startswith('HS'):
+        key = prepare_key(SECRET_KEY)
+        return KeySet(algorithm, key, JWT_KEY_ID, {JWT_KEY_ID: key})
+    if not (JWT_PRIVATE_KEY_FILE and JWT_PUBLIC_KEYS_DIR and JWT_KEY_ID):
+        raise RuntimeError(f'Algorithm {algorithm} requires JWT_PRIVATE_KEY_FILE, JWT_PUBLIC_KEYS_DIR and JWT_KEY_ID')
+    verification_keys = {path.stem: prepare_key(path.read_bytes())
+                         for path in sorted(Path(JWT_PUBLIC_KEYS_DIR).glob('*.pem'))}
+    if JWT_KEY_ID not in verification_keys:
+        raise RuntimeError(f'Public key {JWT_KEY_ID}.pem of signing key is missing in {JWT_PUBLIC_KEYS_DIR}')
+    return KeySet(algorithm, prepare_key(Path(JWT_PRIVATE_KEY_FILE).read_bytes()), JWT_KEY_ID, verification_keys)
+
+key_set = load_key_set()
+
+async def get_user_by_email(email: str, instance: AsyncSession, options: tuple = loaders.USER_PRINCIPAL):
     # Check if user with given email exist (user_id not used in security 
-    # because loging in with email and password)
-    user = instance.execute(db.select(db.UserT).where(db.UserT.email == email)).scalar()
+    # because loging in with email and password). By default only basic
+    # columns are loaded, tasks owned by user are not needed for authentication
+    query = db.select(db.UserT).where(db.UserT.email == email, db.UserT.deleted_at.is_(None)).options(*options)
+    user = (await instance.execute(query)).scalar()
     if user is None:
         raise HTTPException(status_code=404, detail='User not found')
     else:
         return user
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return PasswordHash.check(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await PasswordHash.check_async(plain_password, hashed_password)
 
-def get_password_hash(password: str) -> PasswordHash:
-    return PasswordHash.new(password)
+async def get_password_hash(password: str) -> PasswordHash:
+    return await PasswordHash.new_async(password)
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
@@ -57,42 +124,53 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
-    to_encode.update({'exp': expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode.update({'exp': expire, 'jti': uuid.uuid4().hex})
+    encoded_jwt = key_set.encode(to_encode)
     return encoded_jwt
 
-def authenticate_user(email: str, password: str, instance: Session):
+async def authenticate_user(email: str, password: str, instance: AsyncSession):
     """Loging with email and password"""
-    user = get_user_by_email(email, instance)
+    user = await get_user_by_email(email, instance, options=loaders.USER_CREDENTIALS)
     if not user:
         return False
-    if not verify_password(password, user.password.hash):
+    if not await verify_password(password, user.password.hash):
         return False
+    # Transparent upgrade of hashes created with different bcrypt cost
+    if user.password.needs_rehash():
+        user.password = await get_password_hash(password)
+        await instance.commit()
     return user
 
 
 # NOTE: Maybe divide this function for checking token
 async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], 
-                           instance: Session = Depends(db.get_session)):
+                           instance: AsyncSession = Depends(db.get_async_session)):
+    """User is taken from token claims and checked against revoked tokens in
+    memory, database is used only when revocation list is stale"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail='Could not validate credentials',
         headers={'WWW-Authenticate': 'Bearer'},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email = payload.get('sub')
-        if email is None:
-            raise credentials_exception
-        token_data = TokenData(email=email)
+        payload = key_set.decode(token)
     except ExpiredSignatureError:
         raise HTTPException(status_code=403, detail='Token expired')
     except InvalidTokenError:
         raise credentials_exception
-    user = get_user_by_email(token_data.email, instance)
-    if user is None:
+    if await revocations.is_revoked(payload['jti'], payload['uid'], payload['tv'], instance):
         raise credentials_exception
-    return user
+    return Principal(user_id=payload['uid'], username=payload['name'], email=payload['sub'], role=payload['role'],
+                     jti=payload['jti'], expires_at=datetime.fromtimestamp(payload['exp'], timezone.utc))
+
+async def revoke_token(principal: Principal, instance: AsyncSession):
+    """Revoke token of principal (log out), takes effect on commit"""
+    await revocations.revoke_token(instance, principal.jti, principal.user_id, principal.expires_at)
+
+async def revoke_user_tokens(user_id: int, instance: AsyncSession):
+    """Revoke every token issued to user so far, e.g. when claims of the
+    user changed. Takes effect on commit"""
+    await revocations.revoke_user(instance, user_id, timedelta(minutes=ACCESS_TOKEN_EXPIRE))
 
 # NOTE: No need for this function because token expiration is handled in get_current_user
 # async def get_current_active_user(current_user: Annotated[User, Depends(get_current_user)]):
@@ -100,8 +178,8 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)],
 #         raise HTTPException(status_code=400, detail='Inactive user')
 #     return current_user
 
-def login_for_access_token_function(form_data: OAuth2PasswordRequestForm, instance: Session):
-    user = authenticate_user(form_data.username, form_data.password, instance) # NOTE: Here search in DB for account (by email or name)
+async def login_for_access_token_function(form_data: OAuth2PasswordRequestForm, instance: AsyncSession):
+    user = await authenticate_user(form_data.username, form_data.password, instance) # NOTE: Here search in DB for account (by email or name)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -109,7 +187,9 @@ def login_for_access_token_function(form_data: OAuth2PasswordRequestForm, instan
             headers={'WWW-Authenticate': 'Bearer'},
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE)
+    # Claims are enough to authorize requests without loading the user
     access_token = create_access_token(
-        data={'sub': user.email}, expires_delta=access_token_expires
+        data={'sub': user.email, 'uid': user.user_id, 'name': user.username, 'role': user.role,
+              'tv': user.token_version}, expires_delta=access_token_expires
     ) # For 'sub': user.email because email is used to login
     return Token(access_token=access_token, token_type='bearer')
\ No newline at end of file
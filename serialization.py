@@ -0,0 +1,23 @@
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+from schemas import TaskBrief, TaskBriefPage, TaskPage, TaskSearchPage, UserPage
+
+# Large responses are built here instead of by FastAPI response_model, which
+# validates returned value, converts it to Python structures and encodes them
+# with json module. Adapters are built once at import, validate rows (ORM
+# objects or dicts) and pydantic-core writes JSON bytes directly.
+# Endpoints keep response_model for OpenAPI documentation
+
+TASK_PAGE = TypeAdapter(TaskPage)
+TASK_SEARCH_PAGE = TypeAdapter(TaskSearchPage)
+USER_PAGE = TypeAdapter(UserPage)
+TASK_BRIEF = TypeAdapter(TaskBrief)
+TASK_BRIEF_PAGE = TypeAdapter(TaskBriefPage)
+
+
+def dump_json(adapter: TypeAdapter, value) -> bytes:
+    return adapter.dump_json(adapter.validate_python(value, from_attributes=True))
+
+def json_response(adapter: TypeAdapter, value, headers: dict = None) -> Response:
+    """Response with value validated and encoded by adapter"""
+    return Response(content=dump_json(adapter, value), media_type='application/json', headers=headers)
@@ -0,0 +1,83 @@
+import os
+import pytest
+from sqlalchemy import create_engine, text
+
+# Tests run against PostgreSQL given by TEST_DATABASE_URL, e.g.
+# postgresql://postgres:pw@localhost:5434/tms_test. Its public schema is
+# dropped and recreated by migrations, so use database dedicated to tests.
+# Without TEST_DATABASE_URL every test is skipped
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+if TEST_DATABASE_URL:
+    os.environ['DATABASE_URL'] = TEST_DATABASE_URL
+os.environ.setdefault('SECRET_KEY', 'test-secret-key-test-secret-key-0123')
+os.environ.setdefault('ALGORITHM', 'HS256')
+os.environ.setdefault('ACCESS_TOKEN_EXPIRE', '30')
+# Tests log in and send requests faster than any sensible limit
+for name in ('LOGIN_RATE_LIMIT_EMAIL', 'LOGIN_RATE_LIMIT_IP', 'API_RATE_LIMIT'):
+    os.environ[name] = '0'
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+# Tests clear the cache between requests
+os.environ['RESPONSE_CACHE_BACKEND'] = 'memory'
+
+from fastapi.testclient import TestClient
+import db
+import main
+import revocations
+from cache import response_cache
+from bench.driver import QueryCounter
+
+TABLES = ('users', 'tasks', 'comments', 'user_task_association', 'user_task_counts', 'task_count_deltas',
+          'task_events', 'user_purges', 'token_revocations')
+
+
+@pytest.fixture(scope='session')
+def database():
+    """Migrated empty database, created once per test run"""
+    if not TEST_DATABASE_URL:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    # load_dotenv(override=True) in application modules prefers .env
+    if db.DATABASE_URL != TEST_DATABASE_URL:
+        pytest.exit('DATABASE_URL from .env overrides TEST_DATABASE_URL, refusing to drop its schema')
+    from alembic import command
+    from alembic.config import Config
+    engine = create_engine(TEST_DATABASE_URL)
+    with engine.begin() as connection:
+        connection.execute(text('DROP SCHEMA public CASCADE'))
+        connection.execute(text('CREATE SCHEMA public'))
+    command.upgrade(Config(os.path.join(os.path.dirname(__file__), '..', 'alembic.ini')), 'head')
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def sql(database):
+    """Connection for preparing and checking rows, autocommitted"""
+    with database.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        yield connection
+
+@pytest.fixture
+def client(database):
+    """Test client of application with empty tables and caches"""
+    with database.begin() as connection:
+        connection.execute(text(f'TRUNCATE {", ".join(TABLES)} RESTART IDENTITY CASCADE'))
+        connection.execute(text('UPDATE task_status_totals SET count = 0'))
+    response_cache.backend.cache.clear()
+    revocations.revocation_list.rebuild([])
+    with TestClient(main.app) as test_client:
+        # Authentication doesn't fall back to database while list is loaded
+        test_client.portal.call(revocations.revocation_list.refresh)
+        yield test_client
+
+@pytest.fixture
+def login(client):
+    """Create user and return headers with its access token"""
+    def login(username: str = 'alice', email: str = 'alice@example.com', password: str = 'secret') -> dict:
+        response = client.post('/users/add', params={'username': username, 'email': email, 'password': password})
+        assert response.status_code == 200, response.text
+        response = client.post('/token', data={'username': email, 'password': password})
+        return {'Authorization': f'Bearer {response.json()["access_token"]}'}
+    return login
+
+@pytest.fixture
+def queries():
+    """Counter of SQL statements executed by async engine, bench.driver.QueryCounter"""
+    return QueryCounter
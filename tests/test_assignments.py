@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy import text
+
+
+@pytest.fixture
+def task(client, login):
+    """Task of alice (user 1), bob, carol and dave are users 2, 3 and 4"""
+    headers = login()
+    for name in ('bob', 'carol', 'dave'):
+        login(name, f'{name}@example.com')
+    task_id = client.post('/tasks/add', headers=headers,
+                          params={'user_id': 1, 'title': 'Assigned task', 'description': 'Task'}).json()['task_id']
+    return headers, task_id
+
+def change(client, task, action: str, user_ids: list):
+    headers, task_id = task
+    return client.post(f'/tasks/assignees/{action}', headers=headers,
+                       params={'owner_id': 1, 'task_id': task_id}, json={'user_ids': user_ids})
+
+def assignees(sql, task) -> set:
+    return set(sql.execute(text('SELECT user_id FROM user_task_association WHERE task_id = :task_id'),
+                           {'task_id': task[1]}).scalars())
+
+
+def test_add_assignees_twice_changes_nothing(client, sql, task):
+    response = change(client, task, 'add', [2, 3])
+    assert response.status_code == 200, response.text
+    assert response.json() == {'task_id': task[1], 'added': [2, 3], 'removed': []}
+    response = change(client, task, 'add', [3, 2])
+    assert response.json() == {'task_id': task[1], 'added': [], 'removed': []}
+    assert assignees(sql, task) == {2, 3}
+
+def test_remove_assignees_skips_unassigned(client, sql, task):
+    change(client, task, 'add', [2, 3])
+    response = change(client, task, 'remove', [3, 4])
+    assert response.status_code == 200, response.text
+    assert response.json() == {'task_id': task[1], 'added': [], 'removed': [3]}
+    assert assignees(sql, task) == {2}
+
+def test_replace_assignees(client, sql, task):
+    change(client, task, 'add', [2, 3])
+    response = change(client, task, 'replace', [3, 4])
+    assert response.json() == {'task_id': task[1], 'added': [4], 'removed': [2]}
+    assert assignees(sql, task) == {3, 4}
+    response = change(client, task, 'replace', [])
+    assert response.json() == {'task_id': task[1], 'added': [], 'removed': [3, 4]}
+    assert assignees(sql, task) == set()
+
+def test_unknown_user_rejects_whole_change(client, sql, task):
+    change(client, task, 'add', [2])
+    for action in ('add', 'replace'):
+        response = change(client, task, action, [3, 99])
+        assert response.status_code == 404
+        assert response.json()['detail'] == 'User not found: 99'
+    assert assignees(sql, task) == {2}
+
+def test_only_owner_changes_assignees(client, sql, task):
+    headers, task_id = task
+    response = client.post('/tasks/assignees/add', headers=headers,
+                           params={'owner_id': 2, 'task_id': task_id}, json={'user_ids': [2]})
+    assert response.status_code == 403
+    assert assignees(sql, task) == set()
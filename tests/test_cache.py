@@ -0,0 +1,46 @@
+import asyncio
+import pytest
+from cache import ResponseCache, MemoryBackend, RedisBackend
+
+
+def memory_cache():
+    return ResponseCache(MemoryBackend(maxsize=10, ttl=60))
+
+def redis_cache():
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    return ResponseCache(RedisBackend(client=fakeredis.FakeAsyncRedis(), ttl=60))
+
+
+@pytest.mark.parametrize('create', [memory_cache, redis_cache])
+def test_value_loaded_before_invalidation_is_not_cached(create):
+    async def run():
+        cache = create()
+        value, generation = await cache.lookup('task:1')
+        assert value is None
+        # Writer commits and invalidates while reader loads old row
+        await cache.invalidate('task:1')
+        await cache.set('task:1', b'old', generation)
+        assert (await cache.lookup('task:1'))[0] is None
+        # Next reader loads the new row
+        value, generation = await cache.lookup('task:1')
+        await cache.set('task:1', b'new', generation)
+        assert (await cache.lookup('task:1'))[0] == b'new'
+        await cache.invalidate('task:1', 'task:2')
+        assert (await cache.lookup('task:1'))[0] is None
+    asyncio.run(run())
+
+@pytest.mark.parametrize('create', [memory_cache, redis_cache])
+def test_get_or_load(create):
+    async def run():
+        cache = create()
+        async def load():
+            await cache.invalidate('user:1')
+            return b'old'
+        assert await cache.get_or_load('user:1', load) == b'old'
+        assert await cache.get('user:1') is None
+        async def load():
+            return b'new'
+        assert await cache.get_or_load('user:1', load) == b'new'
+        assert await cache.get('user:1') == b'new'
+    asyncio.run(run())
@@ -0,0 +1,34 @@
+import pytest
+
+
+@pytest.fixture
+def comment(client, login):
+    """Task of alice (user 1) with bob (user 2) assigned, commented by bob.
+    carol (user 3) is assigned too"""
+    headers = login()
+    login('bob', 'bob@example.com')
+    login('carol', 'carol@example.com')
+    task_id = client.post('/tasks/add', headers=headers,
+                          params={'user_id': 1, 'title': 'Commented task', 'description': 'Task'}).json()['task_id']
+    for user_id in (2, 3):
+        client.post('/tasks/assign', headers=headers, params={'owner_id': 1, 'task_id': task_id, 'user_id_to_assign': user_id})
+    response = client.post('/tasks/comments/add', headers=headers,
+                           params={'user_id': 2, 'task_id': task_id, 'comment': 'Comment of bob'})
+    return headers, task_id, response.json()['comment_id']
+
+
+def test_comment_is_deleted_only_by_author_or_task_owner(client, comment):
+    headers, task_id, comment_id = comment
+    response = client.delete('/tasks/comments/delete', headers=headers, params={'user_id': 3, 'comment_id': comment_id})
+    assert response.status_code == 403
+    response = client.post('/tasks/comments/update', headers=headers, params={'user_id': 1, 'comment_id': comment_id},
+                           json={'comment': 'Changed by alice'})
+    assert response.status_code == 403
+    assert len(client.get(f'/tasks/{task_id}/comments', headers=headers).json()['items']) == 1
+
+@pytest.mark.parametrize('user_id', [1, 2])
+def test_delete_comment(client, comment, user_id):
+    headers, task_id, comment_id = comment
+    response = client.delete('/tasks/comments/delete', headers=headers, params={'user_id': user_id, 'comment_id': comment_id})
+    assert response.status_code == 200
+    assert client.get(f'/tasks/{task_id}/comments', headers=headers).json()['items'] == []
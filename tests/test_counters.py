@@ -0,0 +1,78 @@
+import pytest
+from sqlalchemy import text
+import counters
+
+# Counters must equal counts computed from tasks, with deltas pending and
+# after compaction
+
+ACTUAL_TOTALS = "SELECT status, count(*) FROM tasks GROUP BY status"
+ACTUAL_USER = """
+    SELECT 'owner', status, count(*) FROM tasks WHERE owner_id = :user_id GROUP BY status
+    UNION ALL
+    SELECT 'assignee', t.status, count(*) FROM tasks t JOIN user_task_association a ON a.task_id = t.task_id
+    WHERE a.user_id = :user_id GROUP BY t.status"""
+
+
+def add_task(client, headers, owner_id: int, status: str = 'open') -> int:
+    response = client.post('/tasks/add', headers=headers,
+                           params={'user_id': owner_id, 'title': 'Counted task', 'description': 'Task'})
+    task_id = response.json()['task_id']
+    if status != 'open':
+        response = client.post('/tasks/update', headers=headers, params={'owner_id': owner_id, 'task_id': task_id},
+                               json={'status': status})
+        assert response.status_code == 200, response.text
+    return task_id
+
+def assert_counts(client, headers, sql, user_ids):
+    totals = client.get('/tasks/summary', headers=headers).json()['counts']
+    assert {status: count for status, count in totals.items() if count} == dict(sql.execute(text(ACTUAL_TOTALS)).all())
+    for user_id in user_ids:
+        summary = client.get(f'/users/{user_id}/summary', headers=headers).json()
+        counts = {('owner', status): count for status, count in summary['owned'].items() if count}
+        counts.update({('assignee', status): count for status, count in summary['assigned'].items() if count})
+        actual = sql.execute(text(ACTUAL_USER), {'user_id': user_id}).all()
+        assert counts == {(role, status): count for role, status, count in actual}
+
+
+def test_counters_follow_changes(client, login, sql):
+    headers = login()
+    login('bob', 'bob@example.com')
+    login('carol', 'carol@example.com')
+    tasks = [add_task(client, headers, owner_id, status) for owner_id in (1, 2, 3)
+             for status in ('open', 'in_progress', 'done')]
+    for task_id in tasks[:6]:
+        owner_id = 1 if task_id <= 3 else 2
+        client.post('/tasks/assign', headers=headers,
+                    params={'owner_id': owner_id, 'task_id': task_id, 'user_id_to_assign': 3})
+    client.post('/tasks/update', headers=headers, params={'owner_id': 1, 'task_id': 1}, json={'status': 'cancelled'})
+    assert client.delete('/tasks/delete/5', headers=headers).status_code == 200
+    assert_counts(client, headers, sql, [1, 2, 3])
+    assert client.portal.call(counters.compact) > 0
+    assert sql.execute(text('SELECT count(*) FROM task_count_deltas')).scalar() == 0
+    assert_counts(client, headers, sql, [1, 2, 3])
+    # Counters of deleted user are dropped by compaction
+    assert client.delete('/users/delete/2', headers=headers).status_code == 200
+    client.portal.call(counters.compact)
+    assert_counts(client, headers, sql, [1, 3])
+    assert sql.execute(text('SELECT count(*) FROM user_task_counts WHERE user_id = 2')).scalar() == 0
+
+def test_concurrent_status_changes_and_deletes_do_not_wait(client, login, database):
+    headers = login()
+    open_tasks = [add_task(client, headers, 1) for _ in range(3)]
+    done_tasks = [add_task(client, headers, 1, 'done') for _ in range(3)]
+    with database.connect() as first, database.connect() as second:
+        for connection in (first, second):
+            # Waiting for counter row of the other transaction fails instead of deadlock
+            connection.execute(text("SET LOCAL lock_timeout = '1s'"))
+        update = text('UPDATE tasks SET status = :status WHERE task_id = :task_id')
+        first.execute(update, {'status': 'in_progress', 'task_id': open_tasks[0]})
+        second.execute(update, {'status': 'in_progress', 'task_id': done_tasks[0]})
+        first.execute(update, {'status': 'in_progress', 'task_id': done_tasks[1]})
+        second.execute(update, {'status': 'done', 'task_id': open_tasks[1]})
+        first.execute(text('DELETE FROM tasks WHERE task_id IN (:open, :done)'),
+                      {'open': open_tasks[2], 'done': done_tasks[2]})
+        first.commit()
+        second.commit()
+    client.portal.call(counters.compact)
+    totals = client.get('/tasks/summary', headers=headers).json()['counts']
+    assert (totals['open'], totals['in_progress'], totals['done']) == (0, 3, 1)
@@ -0,0 +1,35 @@
+import json
+import time
+import events
+
+
+def test_task_change_is_streamed_to_owner(client, login):
+    headers = login()
+    task_id = client.post('/tasks/add', headers=headers,
+                          params={'user_id': 1, 'title': 'Streamed task', 'description': 'Task'}).json()['task_id']
+    client.portal.call(events.broker.connect)
+    # Stream of GET /events, TestClient would wait for the end of endless response
+    stream = events.stream(1, None)
+
+    async def next_event():
+        return await anext(stream)
+    pending = client.portal.start_task_soon(next_event)
+    while events.broker.subscribers() == 0:
+        assert not pending.done(), pending.result()
+        time.sleep(0.01)
+    response = client.post('/tasks/update', headers=headers, params={'owner_id': 1, 'task_id': task_id},
+                           json={'title': 'Changed task'})
+    assert response.status_code == 200, response.text
+    lines = dict(line.split(': ', 1) for line in pending.result(timeout=10).strip().split('\n'))
+    assert lines['event'] == 'task_updated'
+    assert json.loads(lines['data'])['task_id'] == task_id
+    client.portal.call(stream.aclose)
+    assert events.broker.subscribers() == 0
+
+def test_stream_which_is_never_started_leaves_no_subscription(client, login):
+    login()
+    client.portal.call(events.broker.connect)
+    # Client disconnected before the response started
+    stream = events.stream(1, None)
+    client.portal.call(stream.aclose)
+    assert events.broker.subscribers() == 0
@@ -0,0 +1,58 @@
+import csv
+import datetime
+import io
+import json
+from sqlalchemy import text
+
+
+def add_task(client, headers, title: str) -> int:
+    response = client.post('/tasks/add', headers=headers, params={'user_id': 1, 'title': title, 'description': 'Task'})
+    assert response.status_code == 200, response.text
+    return response.json()['task_id']
+
+def export(client, headers, **params):
+    response = client.get('/tasks/export', headers=headers, params=params)
+    assert response.status_code == 200, response.text
+    return response, [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_incremental_export_with_tombstones(client, login):
+    headers = login()
+    first, second, third = (add_task(client, headers, f'Exported task {number}') for number in range(3))
+    response, items = export(client, headers)
+    assert [item['task_id'] for item in items] == [first, second, third]
+    watermark = response.headers['X-Export-Watermark']
+
+    assert client.post('/tasks/update', headers=headers,
+                       params={'owner_id': 1, 'task_id': second}, json={'title': 'Changed task'}).status_code == 200
+    assert client.delete(f'/tasks/delete/{third}', headers=headers).status_code == 200
+    fourth = add_task(client, headers, 'Exported task 3')
+    response, items = export(client, headers, updated_since=watermark)
+    assert [item['task_id'] for item in items if 'title' in item] == [second, fourth]
+    assert [item['task_id'] for item in items if 'deleted_at' in item] == [third]
+
+    response = client.get('/tasks/export', headers=headers, params={'updated_since': watermark, 'format': 'csv'})
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [(int(row['task_id']), bool(row['deleted_at'])) for row in rows] == [(second, False), (fourth, False),
+                                                                                (third, True)]
+
+def test_watermark_precedes_open_transactions(client, login, database):
+    headers = login()
+    with database.connect() as connection:
+        # Transaction which started before export and commits after it
+        started = connection.execute(text('SELECT now()')).scalar()
+        response, _ = export(client, headers)
+        connection.execute(text("INSERT INTO tasks (owner_id, title, description, status) "
+                                "VALUES (1, 'Late committed task', 'Task', 'open')"))
+        connection.commit()
+    watermark = datetime.datetime.fromisoformat(response.headers['X-Export-Watermark'])
+    assert watermark <= started
+    _, items = export(client, headers, updated_since=response.headers['X-Export-Watermark'])
+    assert [item['title'] for item in items] == ['Late committed task']
+
+def test_export_older_than_tombstones_is_rejected(client, login):
+    headers = login()
+    response = client.get('/tasks/export', headers=headers,
+                          params={'updated_since': (datetime.datetime.now(datetime.timezone.utc) -
+                                                    datetime.timedelta(days=30)).isoformat()})
+    assert response.status_code == 410
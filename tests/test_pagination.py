@@ -0,0 +1,23 @@
+import pytest
+from pagination import pack_cursor, MAX_ID
+
+
+@pytest.mark.parametrize('row_id', [MAX_ID + 1, 10000000000000000000, 0, -1, 1e400])
+@pytest.mark.parametrize('path, cursor', [
+    ('/tasks', lambda row_id: {'id': row_id, 'order': 'asc'}),
+    ('/users', lambda row_id: {'id': row_id, 'order': 'asc'}),
+    ('/tasks/1/comments', lambda row_id: {'key': ['2026-01-01T00:00:00', row_id], 'order': 'asc'}),
+    ('/tasks/search', lambda row_id: {'match': 'fulltext', 'rank': 0.5, 'id': row_id}),
+])
+def test_cursor_with_id_out_of_range_is_rejected(client, login, path, cursor, row_id):
+    headers = login()
+    client.post('/tasks/add', headers=headers, params={'user_id': 1, 'title': 'Paged task', 'description': 'Task'})
+    response = client.get(path, headers=headers, params={'q': 'paged', 'cursor': pack_cursor(cursor(row_id))})
+    assert response.status_code == 400
+    assert response.json()['detail'] == 'Invalid cursor'
+
+def test_cursor_with_largest_id_is_accepted(client, login):
+    headers = login()
+    response = client.get('/tasks', headers=headers, params={'cursor': pack_cursor({'id': MAX_ID, 'order': 'asc'})})
+    assert response.status_code == 200
+    assert response.json()['items'] == []
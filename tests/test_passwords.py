@@ -0,0 +1,16 @@
+import asyncio
+import pwhshr
+from pwhshr import PasswordHash
+
+
+def test_hashing_waits_for_slot_in_every_event_loop():
+    async def hash_many():
+        # More jobs than slots, so some of them wait on the semaphore
+        hashes = await asyncio.gather(*(PasswordHash.new_async('secret', rounds=4)
+                                        for _ in range(pwhshr.BCRYPT_MAX_CONCURRENCY + 2)))
+        return all([await PasswordHash.check_async('secret', password.hash) for password in hashes])
+    try:
+        assert asyncio.run(hash_many())
+        assert asyncio.run(hash_many())
+    finally:
+        pwhshr.shutdown_pool()
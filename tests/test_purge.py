@@ -0,0 +1,69 @@
+import time
+import pytest
+from sqlalchemy import text
+import counters
+import main
+from test_counters import add_task, assert_counts
+
+# Rows which reference bob (user 2) or tasks owned by him
+REMAINING = {
+    'tasks': 'SELECT count(*) FROM tasks WHERE owner_id = 2',
+    'comments': 'SELECT count(*) FROM comments c LEFT JOIN tasks t ON t.task_id = c.task_id '
+                'WHERE c.user_id = 2 OR t.task_id IS NULL',
+    'assignments': 'SELECT count(*) FROM user_task_association a LEFT JOIN tasks t ON t.task_id = a.task_id '
+                   'WHERE a.user_id = 2 OR t.task_id IS NULL',
+    'users': 'SELECT count(*) FROM users WHERE user_id = 2',
+    'counters': 'SELECT count(*) FROM user_task_counts WHERE user_id = 2',
+}
+
+
+@pytest.fixture
+def owner(client, login, sql):
+    """bob (user 2) owns tasks assigned to and commented by carol (user 3),
+    he is assigned to and comments a task of alice (user 1)"""
+    headers = login()
+    login('bob', 'bob@example.com')
+    login('carol', 'carol@example.com')
+    alice_task = add_task(client, headers, 1)
+    bob_tasks = [add_task(client, headers, 2, status) for status in ('open', 'in_progress', 'done', 'open', 'done')]
+    for task_id, owner_id in [(alice_task, 1)] + [(task_id, 2) for task_id in bob_tasks]:
+        for user_id in (2, 3):
+            if user_id != owner_id:
+                client.post('/tasks/assign', headers=headers,
+                            params={'owner_id': owner_id, 'task_id': task_id, 'user_id_to_assign': user_id})
+                client.post('/tasks/comments/add', headers=headers,
+                            params={'user_id': user_id, 'task_id': task_id, 'comment': 'Comment'})
+    assert sql.execute(text(REMAINING['comments'])).scalar() == 1
+    return headers, alice_task
+
+def assert_removed(client, headers, sql, alice_task):
+    client.portal.call(counters.compact)
+    assert {name: sql.execute(text(query)).scalar() for name, query in REMAINING.items()} == dict.fromkeys(REMAINING, 0)
+    # Task of alice keeps carol's comment and assignment
+    task = client.get(f'/tasks/{alice_task}', headers=headers).json()
+    assert [user['user_id'] for user in task['assigned_users']] == [3]
+    assert [comment['user_id'] for comment in task['comments']] == [3]
+    assert_counts(client, headers, sql, [1, 3])
+
+
+def test_delete_user_removes_owned_tasks_and_references(client, sql, owner):
+    headers, alice_task = owner
+    response = client.delete('/users/delete/2', headers=headers)
+    assert response.status_code == 200, response.text
+    assert_removed(client, headers, sql, alice_task)
+
+def test_user_owning_many_tasks_is_purged_in_background(client, sql, owner, monkeypatch):
+    headers, alice_task = owner
+    monkeypatch.setattr(main, 'USER_PURGE_THRESHOLD', 2)
+    monkeypatch.setattr(main, 'USER_PURGE_BATCH', 2)
+    response = client.delete('/users/delete/2', headers=headers)
+    assert response.status_code == 202, response.text
+    assert client.get('/users/2', headers=headers).status_code == 404
+    for _ in range(100):
+        purge = client.get('/users/2/purge', headers=headers).json()
+        if purge['finished_at'] is not None:
+            break
+        time.sleep(0.1)
+    assert (purge['tasks_total'], purge['tasks_deleted']) == (5, 5)
+    assert purge['finished_at'] is not None
+    assert_removed(client, headers, sql, alice_task)
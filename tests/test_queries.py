@@ -0,0 +1,72 @@
+import pytest
+from cache import response_cache
+
+# Number of SQL statements of read endpoints must not grow with number of
+# tasks, assignees and comments (no N+1 loading). Responses are not cached
+# in between
+ENDPOINTS = [
+    ('/users', 4),
+    ('/users/1', 4),
+    ('/users/me', 4),
+    ('/tasks', 4),
+    ('/tasks?view=summary', 2),
+    ('/tasks/1', 4),
+    ('/tasks/1?view=summary', 1),
+    ('/tasks/1/comments', 1),
+]
+
+
+def add_tasks(client, headers, user_ids: list, tasks: int, comments: int):
+    for number in range(tasks):
+        owner_id = user_ids[number % len(user_ids)]
+        response = client.post('/tasks/add', headers=headers,
+                               params={'user_id': owner_id, 'title': f'Task number {number}', 'description': 'Task'})
+        assert response.status_code == 200, response.text
+        task_id = response.json()['task_id']
+        for user_id in user_ids:
+            response = client.post('/tasks/assign', headers=headers,
+                                   params={'owner_id': owner_id, 'task_id': task_id, 'user_id_to_assign': user_id})
+            assert response.status_code == 200, response.text
+        for comment in range(comments):
+            response = client.post('/tasks/comments/add', headers=headers,
+                                   params={'user_id': owner_id, 'task_id': task_id, 'comment': f'Comment {comment}'})
+            assert response.status_code == 200, response.text
+
+def count_queries(client, headers, queries) -> dict:
+    counts = {}
+    for path, _ in ENDPOINTS:
+        response_cache.backend.cache.clear()
+        with queries() as counter:
+            response = client.get(path, headers=headers)
+        assert response.status_code == 200, response.text
+        counts[path] = counter.count
+    return counts
+
+
+def test_query_count_of_read_endpoints(client, login, queries):
+    headers = login()
+    user_ids = [1] + [client.post('/users/add', params={'username': f'user{number}', 'email': f'user{number}@example.com',
+                                                        'password': 'secret'}).json()['user_id'] for number in range(2)]
+    add_tasks(client, headers, user_ids, tasks=2, comments=1)
+    small = count_queries(client, headers, queries)
+    add_tasks(client, headers, user_ids, tasks=20, comments=5)
+    # Cached responses were invalidated by the changes
+    large = count_queries(client, headers, queries)
+    assert small == large == dict(ENDPOINTS)
+
+@pytest.mark.parametrize('path', ['/users/1', '/tasks/1'])
+def test_cached_response(client, login, queries, path):
+    headers = login()
+    add_tasks(client, headers, [1], tasks=1, comments=3)
+    response = client.get(path, headers=headers)
+    with queries() as counter:
+        assert client.get(path, headers=headers).content == response.content
+        not_modified = client.get(path, headers={**headers, 'If-None-Match': response.headers['ETag']})
+    assert not_modified.status_code == 304
+    assert counter.count == 0
+    # Without cache entry only version is read to answer If-None-Match
+    response_cache.backend.cache.clear()
+    with queries() as counter:
+        not_modified = client.get(path, headers={**headers, 'If-None-Match': response.headers['ETag']})
+    assert not_modified.status_code == 304
+    assert counter.count == 1
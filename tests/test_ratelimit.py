@@ -0,0 +1,64 @@
+import asyncio
+import time
+import pytest
+import ratelimit
+from ratelimit import Rate, MemoryBackend, RedisBackend, RateLimiter, parse_rate
+
+
+def memory_backend(rate):
+    return MemoryBackend(rate)
+
+def redis_backend(rate):
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    return RedisBackend(rate, client=fakeredis.FakeAsyncRedis())
+
+def acquire(backend, key: str = 'key') -> float:
+    return asyncio.run(backend.acquire(key))
+
+
+def test_parse_rate():
+    assert parse_rate('5/minute') == Rate(5, 5 / 60)
+    assert parse_rate(' 100/second ') == Rate(100, 100)
+    assert parse_rate('') is None
+    assert parse_rate('0') is None
+    assert parse_rate('0/hour') is None
+    for value in ('5', '5/day', 'five/minute', '-1/second'):
+        with pytest.raises(ValueError):
+            parse_rate(value)
+
+@pytest.mark.parametrize('create', [memory_backend, redis_backend])
+def test_bucket_denies_requests_above_capacity(create):
+    backend = create(Rate(2, 2 / 3600))
+    assert acquire(backend) == 0
+    assert acquire(backend) == 0
+    # Next token in half an hour
+    assert 1790 < acquire(backend) <= 1800
+    assert acquire(backend, 'other key') == 0
+
+def test_memory_bucket_refills(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: clock[0])
+    backend = MemoryBackend(Rate(2, 2 / 60))
+    assert [acquire(backend) for _ in range(3)] == [0, 0, 30]
+    clock[0] += 15
+    assert acquire(backend) == 15
+    clock[0] += 15
+    assert acquire(backend) == 0
+    assert acquire(backend) == 30
+    # Bucket is never filled above capacity
+    clock[0] += 600
+    assert [acquire(backend) for _ in range(3)] == [0, 0, 30]
+
+def test_login_attempts_above_limit_are_rejected(client, login, monkeypatch):
+    login()
+    monkeypatch.setattr(ratelimit, 'login_email_limiter', RateLimiter('login_email', MemoryBackend(Rate(2, 2 / 60))))
+    # Emails differing in case and whitespace share the bucket
+    for email, status_code in (('alice@example.com', 401), (' ALICE@example.com', 404)):
+        response = client.post('/token', data={'username': email, 'password': 'wrong'})
+        assert response.status_code == status_code
+    response = client.post('/token', data={'username': 'alice@example.com', 'password': 'secret'})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '30'
+    response = client.post('/token', data={'username': 'bob@example.com', 'password': 'secret'})
+    assert response.status_code == 404
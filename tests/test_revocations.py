@@ -0,0 +1,58 @@
+import datetime
+import jwt
+import pytest
+from sqlalchemy import text
+import db
+import revocations
+
+
+def revoke_user(user_id: int, end: str):
+    async def revoke():
+        async with db.AsyncSessionLocal() as instance:
+            await revocations.revoke_user(instance, user_id, datetime.timedelta(minutes=30))
+            if end == 'commit':
+                await instance.commit()
+            elif end == 'rollback':
+                await instance.rollback()
+    return revoke
+
+def token_id(headers: dict) -> str:
+    token = headers['Authorization'].removeprefix('Bearer ')
+    return jwt.decode(token, options={'verify_signature': False})['jti']
+
+
+@pytest.mark.parametrize('end', ['rollback', 'close'])
+def test_rolled_back_revocation_is_ignored(client, login, end):
+    headers = login()
+    client.portal.call(revoke_user(1, end))
+    assert client.get('/users/me', headers=headers).status_code == 200
+    client.portal.call(revoke_user(1, 'commit'))
+    assert client.get('/users/me', headers=headers).status_code == 401
+
+def test_log_out(client, login):
+    headers = login()
+    response = client.post('/token', data={'username': 'alice@example.com', 'password': 'secret'})
+    other = {'Authorization': f'Bearer {response.json()["access_token"]}'}
+    assert client.post('/token/revoke', headers=headers).status_code == 204
+    assert client.get('/users/me', headers=headers).status_code == 401
+    assert client.get('/users/me', headers=other).status_code == 200
+    assert client.post('/token/revoke', headers=other, params={'everywhere': True}).status_code == 204
+    assert client.get('/users/me', headers=other).status_code == 401
+
+def test_revocation_committed_with_lower_id_is_loaded(client, login, sql):
+    headers = login()
+    response = client.post('/token', data={'username': 'alice@example.com', 'password': 'secret'})
+    other = {'Authorization': f'Bearer {response.json()["access_token"]}'}
+    jti = token_id(other)
+    insert = text("INSERT INTO token_revocations (revocation_id, user_id, jti, expires_at) "
+                  "VALUES (:revocation_id, 1, :jti, now() + :expires * interval '1 minute')")
+    sql.execute(insert, {'revocation_id': 1, 'jti': 'expiring', 'expires': 30})
+    sql.execute(insert, {'revocation_id': 3, 'jti': 'other', 'expires': 30})
+    client.portal.call(revocations.revocation_list.refresh)
+    # One revocation is purged while other one, with ID allocated earlier,
+    # commits: count and maximum ID of rows stay the same
+    sql.execute(text("DELETE FROM token_revocations WHERE revocation_id = 1"))
+    sql.execute(insert, {'revocation_id': 2, 'jti': jti, 'expires': 30})
+    client.portal.call(revocations.revocation_list.refresh)
+    assert client.get('/users/me', headers=other).status_code == 401
+    assert client.get('/users/me', headers=headers).status_code == 200
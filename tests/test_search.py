@@ -0,0 +1,87 @@
+import pytest
+from sqlalchemy import text
+import search
+
+# Search needs pg_trgm extension, created by migration 0004
+
+TASKS = [
+    ('Release notes', 'Write notes of the next release'),
+    ('Database migration', 'Move customer invoices to the new database'),
+    ('Frontend review', 'Review login page'),
+    ('Quarterly report', 'Numbers for the meeting'),
+]
+
+
+@pytest.fixture
+def tasks(client, login):
+    headers = login()
+    for title, description in TASKS:
+        response = client.post('/tasks/add', headers=headers,
+                               params={'user_id': 1, 'title': title, 'description': description})
+        assert response.status_code == 200, response.text
+    for task_id, comment in ((3, 'Release blocker, login fails'), (4, 'Postponed after release'),
+                             (4, 'Asked about the release again')):
+        response = client.post('/tasks/comments/add', headers=headers,
+                               params={'user_id': 1, 'task_id': task_id, 'comment': comment})
+        assert response.status_code == 200, response.text
+    return headers
+
+def search_tasks(client, headers, **params):
+    response = client.get('/tasks/search', headers=headers, params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def search_all(client, headers, **params) -> list:
+    """IDs of all pages of results"""
+    task_ids, cursor = [], None
+    while True:
+        page = search_tasks(client, headers, limit=1, **params, **({'cursor': cursor} if cursor else {}))
+        task_ids += [task['task_id'] for task in page['items']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            return task_ids
+
+
+def test_fulltext_matches_tasks_and_comments(client, tasks):
+    page = search_tasks(client, tasks, q='release', match='fulltext')
+    assert page['match'] == 'fulltext'
+    # Title and description outrank comments
+    task_ids = [task['task_id'] for task in page['items']]
+    assert task_ids[0] == 1 and sorted(task_ids[1:]) == [3, 4]
+    assert search_all(client, tasks, q='release', match='fulltext') == task_ids
+    assert [task['task_id'] for task in search_tasks(client, tasks, q='login', match='fulltext')['items']] == [3]
+    assert [task['task_id'] for task in search_tasks(client, tasks, q='invoices customers')['items']] == [2]
+    assert search_tasks(client, tasks, q='release -login', match='fulltext')['items'][-1]['task_id'] == 4
+
+def test_fuzzy_matches_similar_titles_and_prefixes(client, tasks):
+    assert [task['task_id'] for task in search_tasks(client, tasks, q='Relase notes', match='fuzzy')['items']] == [1]
+    assert [task['task_id'] for task in search_tasks(client, tasks, q='quart', match='fuzzy')['items']] == [4]
+    assert search_tasks(client, tasks, q='100%', match='fuzzy')['items'] == []
+
+def test_auto_falls_back_to_fuzzy(client, tasks):
+    page = search_tasks(client, tasks, q='migration')
+    assert (page['match'], [task['task_id'] for task in page['items']]) == ('fulltext', [2])
+    page = search_tasks(client, tasks, q='Databse migraton')
+    assert (page['match'], [task['task_id'] for task in page['items']]) == ('fuzzy', [2])
+    assert search_tasks(client, tasks, q='nothing like this')['items'] == []
+
+def test_cursor_of_other_match_is_rejected(client, tasks):
+    cursor = search_tasks(client, tasks, q='release', match='fulltext', limit=1)['next_cursor']
+    response = client.get('/tasks/search', headers=tasks, params={'q': 'release', 'match': 'fuzzy', 'cursor': cursor})
+    assert response.status_code == 400
+
+@pytest.mark.parametrize('ranked, indexes', [
+    (search._fulltext_ranked, {'ix_tasks_search_vector', 'ix_comments_search_vector'}),
+    (search._fuzzy_ranked, {'ix_tasks_title_trgm'}),
+])
+def test_search_uses_indexes(sql, ranked, indexes):
+    query = ranked('release').compile(dialect=sql.dialect)
+    # Tables are tiny, planner would read them whole (or whole by other index) otherwise
+    sql.execute(text('SET enable_seqscan = off'))
+    sql.execute(text('SET enable_indexscan = off'))
+    try:
+        plan = '\n'.join(row[0] for row in sql.exec_driver_sql(f'EXPLAIN {query}', query.params))
+    finally:
+        sql.execute(text('RESET enable_seqscan'))
+        sql.execute(text('RESET enable_indexscan'))
+    assert all(f'Index Scan on {index}' in plan for index in indexes), plan
@@ -0,0 +1,30 @@
+import main
+
+
+def test_create_user_with_email_in_use(client, login):
+    login()
+    response = client.post('/users/add', params={'username': 'bob', 'email': 'alice@example.com', 'password': 'secret'})
+    assert response.status_code == 409
+    assert response.json()['detail'] == 'Email already in use'
+
+def test_update_user_with_email_in_use(client, login):
+    headers = login()
+    login('bob', 'bob@example.com')
+    response = client.post('/users/update', headers=headers, params={'user_id': 1}, json={'email': 'bob@example.com'})
+    assert response.status_code == 409
+    assert response.json()['detail'] == 'Email already in use'
+    assert client.get('/users/1', headers=headers).json()['email'] == 'alice@example.com'
+
+def test_create_users_bulk_with_email_taken_concurrently(client, login, monkeypatch):
+    headers = login()
+    login('bob', 'bob@example.com')
+    # Email taken by other request between the check and the insert
+    checked = main.find_existing_in_db
+    monkeypatch.setattr(main, 'find_existing_in_db', lambda *args: checked(args[0], set(), *args[2:]))
+    response = client.post('/users/add/bulk', headers=headers,
+                           json=[{'username': 'carol', 'email': 'carol@example.com', 'password': 'secret'},
+                                 {'username': 'bob2', 'email': 'bob@example.com', 'password': 'secret'}])
+    assert response.status_code == 200, response.text
+    assert response.json()['created'] == 1
+    assert [(item['id'] is not None, item['error']) for item in response.json()['results']] == \
+        [(True, None), (False, 'Email already in use')]